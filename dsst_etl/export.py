@@ -0,0 +1,170 @@
+"""
+Stream query results out of Postgres with constant memory.
+
+Rows are read in batches from a server-side (named) cursor, so the result
+set never sits in client memory, or copied with ``COPY (...) TO STDOUT``
+when the output is csv. Works with psycopg2 connections.
+"""
+
+import csv
+import gzip
+import uuid
+from pathlib import Path
+from typing import Iterator
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from dsst_etl import logger
+
+DEFAULT_BATCH_SIZE = 10000
+
+
+def stream_query(
+    conn, query: str, params=None, batch_size: int = DEFAULT_BATCH_SIZE
+) -> Iterator[list[tuple]]:
+    """
+    Yield the rows of a query in batches from a server-side cursor.
+
+    Args:
+        conn: psycopg2 connection, not in autocommit mode
+        query (str): SELECT statement, with %s placeholders for ``params``
+        params: Query parameters
+        batch_size (int): Rows fetched from the server at a time
+
+    Returns:
+        Iterator[list[tuple]]: Batches of at most ``batch_size`` rows
+    """
+    with conn.cursor(name=f"export_{uuid.uuid4().hex}") as cursor:
+        cursor.itersize = batch_size
+        cursor.execute(query, params)
+        while rows := cursor.fetchmany(batch_size):
+            yield rows
+
+
+def iter_rows(
+    conn, query: str, params=None, batch_size: int = DEFAULT_BATCH_SIZE
+) -> Iterator[tuple]:
+    """Yield the rows of a query one by one, see :func:`stream_query`."""
+    for rows in stream_query(conn, query, params, batch_size):
+        yield from rows
+
+
+class RowWriter:
+    """
+    Append batches of rows to a csv, csv.gz or Parquet file, chosen by the
+    file suffix. Parquet column types are taken from ``schema`` or inferred
+    from the first batch, with all-null columns typed as strings.
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        columns: list[str],
+        schema: pa.Schema | None = None,
+    ):
+        self.path = Path(path)
+        self.columns = columns
+        self.schema = schema
+        self.rows = 0
+        self._parquet = self.path.suffix == ".parquet"
+        self._writer = None
+        if not self._parquet:
+            if self.path.suffix == ".gz":
+                self._file = gzip.open(self.path, "wt", newline="")
+            else:
+                self._file = open(self.path, "w", newline="")
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(columns)
+
+    def write(self, rows: list[tuple]) -> None:
+        if not rows:
+            return
+        if self._parquet:
+            self._write_parquet(rows)
+        else:
+            self._writer.writerows(rows)
+        self.rows += len(rows)
+
+    def _write_parquet(self, rows: list[tuple]) -> None:
+        values = list(zip(*rows))
+        if self.schema is None:
+            fields = []
+            for column, column_values in zip(self.columns, values):
+                type_ = pa.array(column_values).type
+                fields.append((column, pa.string() if type_ == pa.null() else type_))
+            self.schema = pa.schema(fields)
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self.path, self.schema)
+        arrays = [
+            pa.array(column_values, type=field.type)
+            for column_values, field in zip(values, self.schema)
+        ]
+        self._writer.write_table(pa.Table.from_arrays(arrays, schema=self.schema))
+
+    def close(self) -> None:
+        if self._parquet:
+            if self._writer is None:
+                # no rows: still write a readable, empty file
+                schema = self.schema or pa.schema(
+                    [(column, pa.string()) for column in self.columns]
+                )
+                self._writer = pq.ParquetWriter(self.path, schema)
+            self._writer.close()
+        else:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def export_query(
+    conn,
+    query: str,
+    path: str | Path,
+    params=None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> int:
+    """
+    Write the result of a query to a csv, csv.gz or Parquet file.
+
+    csv output is produced by the server with ``COPY (query) TO STDOUT``;
+    Parquet output is written batch by batch from a server-side cursor.
+
+    Args:
+        conn: psycopg2 connection
+        query (str): SELECT statement, with %s placeholders for ``params``
+        path (str | Path): Output file; the suffix selects the format
+        params: Query parameters
+        batch_size (int): Rows per batch for Parquet output
+
+    Returns:
+        int: Number of rows written
+    """
+    path = Path(path)
+    if path.suffix == ".parquet":
+        rows = 0
+        with conn.cursor(name=f"export_{uuid.uuid4().hex}") as cursor:
+            cursor.itersize = batch_size
+            cursor.execute(query, params)
+            batch = cursor.fetchmany(batch_size)
+            columns = [column.name for column in cursor.description]
+            with RowWriter(path, columns) as writer:
+                while batch:
+                    writer.write(batch)
+                    batch = cursor.fetchmany(batch_size)
+                rows = writer.rows
+    else:
+        with conn.cursor() as cursor:
+            sql = cursor.mogrify(query, params).decode()
+            opener = gzip.open if path.suffix == ".gz" else open
+            with opener(path, "wt", newline="") as f:
+                cursor.copy_expert(
+                    f"COPY ({sql}) TO STDOUT WITH (FORMAT CSV, HEADER)", f
+                )
+            rows = cursor.rowcount
+    logger.info(f"Exported {rows} rows to {path}")
+    return rows
@@ -0,0 +1,172 @@
+import asyncio
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import aiohttp
+
+from dsst_etl import logger
+from dsst_etl.http_cache import ResponseCache
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """
+    Token-bucket rate limiter shared by concurrent requests.
+
+    Callers reserve a token and sleep until it is available, so the limiter
+    works for both threads (:meth:`wait`) and asyncio tasks (:meth:`acquire`).
+    The rate adapts: :meth:`penalize` halves it after a 429 and
+    :meth:`reward` slowly restores it after successful requests.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        capacity: float | None = None,
+        min_rate: float = 0.5,
+    ):
+        """
+        Args:
+            rate (float): Maximum number of requests per second
+            capacity (float, optional): Burst size, defaults to ``rate``
+            min_rate (float): Floor for the adaptive rate
+        """
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._penalized = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Take a token and return how long to wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.capacity, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def wait(self) -> None:
+        """Block the calling thread until a token is available."""
+        delay = self.reserve()
+        if delay:
+            time.sleep(delay)
+
+    async def acquire(self) -> None:
+        """Wait in the event loop until a token is available."""
+        delay = self.reserve()
+        if delay:
+            await asyncio.sleep(delay)
+
+    def penalize(self) -> None:
+        """
+        Halve the rate after the server signalled it is overloaded. Requests
+        already in flight tend to be rejected together, so the rate is
+        halved at most once per second.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if now - self._penalized < 1:
+                return
+            self._penalized = now
+            self.rate = max(self.min_rate, self.rate / 2)
+            self._tokens = min(self._tokens, 0)
+        logger.warning(f"Rate limited, slowing down to {self.rate:.2f} req/s")
+
+    def reward(self) -> None:
+        """Additively recover the rate after a successful request."""
+        if self.rate < self.max_rate:
+            with self._lock:
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 100)
+
+
+def retry_delay(attempt: int, retry_after: str | None = None) -> float:
+    """
+    Seconds to wait before retrying: the server's Retry-After header when
+    present, otherwise exponential backoff with jitter.
+    """
+    if retry_after:
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            try:
+                retry_at = parsedate_to_datetime(retry_after).timestamp()
+                return max(0.0, retry_at - time.time())
+            except (TypeError, ValueError):
+                pass
+    return min(60.0, 2**attempt) * (0.5 + random.random() / 2)
+
+
+def create_session(
+    concurrency: int, headers: dict | None = None, timeout: float = 60
+) -> aiohttp.ClientSession:
+    """
+    Create an aiohttp session with a keep-alive connection pool sized to
+    the number of concurrent requests.
+    """
+    connector = aiohttp.TCPConnector(limit=concurrency, keepalive_timeout=60)
+    return aiohttp.ClientSession(
+        connector=connector,
+        headers=headers,
+        timeout=aiohttp.ClientTimeout(total=timeout),
+    )
+
+
+async def fetch(
+    session: aiohttp.ClientSession,
+    url: str,
+    bucket: TokenBucket,
+    params: dict | None = None,
+    max_retries: int = 5,
+    cache: ResponseCache | None = None,
+) -> tuple[int, bytes]:
+    """
+    GET a URL through the rate limiter, retrying 429/5xx responses and
+    connection errors with backoff. With a ``cache``, cached responses are
+    returned without a request and successful responses are stored.
+
+    Returns:
+        tuple[int, bytes]: Final status code and response body
+    """
+    if cache is not None:
+        key = ResponseCache.key("GET", url, params)
+        if (cached := cache.get(key)) is not None:
+            meta, body = cached
+            return meta["status"], body
+
+    attempt = 0
+    while True:
+        await bucket.acquire()
+        try:
+            async with session.get(url, params=params) as response:
+                body = await response.read()
+                status = response.status
+                retry_after = response.headers.get("Retry-After")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            if attempt >= max_retries:
+                raise
+            logger.debug(f"Request error for {url}: {e}")
+            status, body, retry_after = None, b"", None
+
+        if status is not None and status not in RETRY_STATUSES:
+            bucket.reward()
+            if cache is not None and status == 200:
+                cache.set(key, body, url=url, status=status)
+            return status, body
+        if attempt >= max_retries:
+            return status, body
+
+        if status == 429:
+            bucket.penalize()
+        attempt += 1
+        await asyncio.sleep(retry_delay(attempt, retry_after))
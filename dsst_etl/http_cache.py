@@ -0,0 +1,192 @@
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from dsst_etl import logger
+
+from .config import config
+
+if TYPE_CHECKING:
+    from dsst_etl.harvest import TokenBucket
+
+DEFAULT_CACHE_DIR = Path(getattr(config, "HTTP_CACHE_DIR", None) or ".http_cache")
+DEFAULT_TTL = float(getattr(config, "HTTP_CACHE_TTL_DAYS", None) or 30) * 86400
+DEFAULT_MAX_BYTES = int(getattr(config, "HTTP_CACHE_MAX_MB", None) or 2048) * 2**20
+
+
+class ResponseCache:
+    """
+    On-disk cache of successful HTTP responses shared by the scrapers.
+
+    Entries are keyed by the sha256 of the request method, full URL and body,
+    and stored gzip-compressed as ``<key[:2]>/<key>.gz``: one JSON metadata
+    line followed by the response body. Entries older than ``ttl`` seconds
+    are ignored, and once the cache grows past ``max_bytes`` the least
+    recently used entries (by file mtime, refreshed on every hit) are
+    removed.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str | Path = DEFAULT_CACHE_DIR,
+        ttl: float = DEFAULT_TTL,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+    ):
+        """
+        Args:
+            cache_dir (str | Path): Directory holding the cache entries
+            ttl (float): Seconds an entry stays valid
+            max_bytes (int): Size of the cache that triggers eviction
+        """
+        self.cache_dir = Path(cache_dir)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._size = None
+        self._lock = threading.Lock()
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def key(
+        method: str, url: str, params: dict | None = None, body: bytes | None = None
+    ) -> str:
+        """Cache key of a request; params are merged into the URL first."""
+        prepared = requests.PreparedRequest()
+        prepared.prepare_url(url, params)
+        digest = hashlib.sha256(f"{method.upper()} {prepared.url}\n".encode())
+        if body:
+            digest.update(body if isinstance(body, bytes) else str(body).encode())
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.gz"
+
+    def get(self, key: str) -> tuple[dict, bytes] | None:
+        """Return (metadata, body) for a fresh entry, or None."""
+        path = self._path(key)
+        try:
+            with gzip.open(path, "rb") as f:
+                meta = json.loads(f.readline())
+                body = f.read()
+        except (FileNotFoundError, EOFError, OSError, ValueError):
+            self.misses += 1
+            return None
+
+        if time.time() - meta["stored_at"] > self.ttl:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            # Evicted by another thread after the read; the body is still good
+            pass
+        return meta, body
+
+    def set(self, key: str, body: bytes, **meta) -> None:
+        """Store a response body with metadata such as url and status."""
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        meta["stored_at"] = time.time()
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        with os.fdopen(fd, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb") as f:
+            f.write(json.dumps(meta).encode() + b"\n")
+            f.write(body)
+        os.replace(tmp, path)
+
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan_size()
+            try:
+                self._size += path.stat().st_size
+            except FileNotFoundError:
+                # Another thread evicted the entry before the lock was taken
+                return
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _entries(self) -> list[tuple[Path, os.stat_result]]:
+        return [(p, p.stat()) for p in self.cache_dir.glob("*/*.gz")]
+
+    def _scan_size(self) -> int:
+        return sum(stat.st_size for _, stat in self._entries())
+
+    def _evict(self) -> None:
+        """Remove least recently used entries until 90% of max_bytes."""
+        entries = sorted(self._entries(), key=lambda entry: entry[1].st_mtime)
+        target = self.max_bytes * 0.9
+        size = sum(stat.st_size for _, stat in entries)
+        removed = 0
+        for path, stat in entries:
+            if size <= target:
+                break
+            path.unlink(missing_ok=True)
+            size -= stat.st_size
+            removed += 1
+        self._size = size
+        logger.info(f"Evicted {removed} entries from {self.cache_dir}")
+
+
+class CachedSession(requests.Session):
+    """
+    requests.Session that serves successful GET responses from a
+    :class:`ResponseCache`. Other methods and streamed requests go straight
+    to the network. With a ``bucket``, requests that reach the network wait
+    on the rate limiter; cache hits do not.
+    """
+
+    def __init__(
+        self,
+        cache: ResponseCache | None = None,
+        bucket: "TokenBucket | None" = None,
+    ):
+        super().__init__()
+        self.cache = cache or ResponseCache()
+        self.bucket = bucket
+
+    def _send(self, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+        if self.bucket is not None:
+            self.bucket.wait()
+        return super().send(request, **kwargs)
+
+    def send(self, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+        if request.method != "GET" or kwargs.get("stream"):
+            return self._send(request, **kwargs)
+
+        key = ResponseCache.key(request.method, request.url, body=request.body)
+        if (cached := self.cache.get(key)) is not None:
+            meta, body = cached
+            response = requests.Response()
+            response.status_code = meta["status"]
+            response.headers = CaseInsensitiveDict(meta.get("headers", {}))
+            response.headers["X-Cache"] = "hit"
+            response._content = body
+            response.encoding = requests.utils.get_encoding_from_headers(
+                response.headers
+            )
+            response.url = request.url
+            response.request = request
+            return response
+
+        response = self._send(request, **kwargs)
+        if response.status_code == 200:
+            content_type = response.headers.get("Content-Type")
+            self.cache.set(
+                key,
+                response.content,
+                url=request.url,
+                status=response.status_code,
+                headers={"Content-Type": content_type} if content_type else {},
+            )
+        return response
@@ -0,0 +1,163 @@
+"""
+Parse NIH intramural annual reports (``searchview.taf?ipid=...`` pages).
+
+A report names its project in a ``contentlabel`` div, lists investigators in
+``pigrid`` divs following ``headinggrid`` labels, and publications as
+``publistgrid`` divs, each followed by a ``pubmedlinksgrid`` div with a
+``showlinkpmid`` link. The default backend finds these with precompiled
+lxml XPath expressions; the slower BeautifulSoup backend, with Python's
+``html.parser``, gives the same results and is kept for comparison.
+"""
+
+import re
+
+import lxml.html
+from bs4 import BeautifulSoup
+from lxml import etree
+
+PI_LABELS = {
+    "Lead Investigator",
+    "Principal Investigator",
+    "Core Lead",
+    "Lead Investigators",
+    "Principal Investigators",
+    "Core Leads",
+}
+REPORT_COLUMNS = ["IPID", "PI", "PMID", "DOI", "PROJECT"]
+PMID_RE = re.compile(r"pubmed/(\d+)")
+# from regex101, tested on 2019-2022 data
+DOI_RE = re.compile(r'(10[.]\d{4,}[^\s"/<>]*/[^\s"<>]+)')
+PUNCTUATION_RE = re.compile(r"[^\w\s]")
+
+
+def _has_class(name: str) -> str:
+    """XPath predicate matching one class of a multi-class attribute."""
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+_CONTENTLABEL = etree.XPath(f"(//div[{_has_class('contentlabel')}])[1]")
+_HEADINGS = etree.XPath(f"//div[{_has_class('headinggrid')}]")
+# first match after the element in document order, like bs4's find_next
+_NEXT_PIGRID = etree.XPath(
+    f"(descendant::div[{_has_class('pigrid')}]"
+    f" | following::div[{_has_class('pigrid')}])[1]"
+)
+_DIVS = etree.XPath(".//div")
+_PUBLICATIONS = etree.XPath(f"//div[{_has_class('publistgrid')}]")
+_NEXT_LINKS = etree.XPath(
+    f"(descendant::div[{_has_class('pubmedlinksgrid')}]"
+    f" | following::div[{_has_class('pubmedlinksgrid')}])[1]"
+)
+_PMID_HREF = etree.XPath(f"(.//div[{_has_class('showlinkpmid')}])[1]//a/@href")
+
+
+def _extract_lxml(html: str | bytes) -> tuple:
+    root = lxml.html.fromstring(html)
+    label = _CONTENTLABEL(root)
+    project_text = label[0].text_content() if label else None
+
+    pi_listings = []
+    for head in _HEADINGS(root):
+        pigrid = _NEXT_PIGRID(head)
+        pi_listings.append(
+            (
+                head.text_content(),
+                [div.text_content() for div in _DIVS(pigrid[0])] if pigrid else [],
+            )
+        )
+
+    publications = []
+    for publication in _PUBLICATIONS(root):
+        links = _NEXT_LINKS(publication)
+        hrefs = _PMID_HREF(links[0]) if links else []
+        publications.append(
+            (publication.text_content(), str(hrefs[0]) if hrefs else None)
+        )
+    return project_text, pi_listings, publications
+
+
+def _extract_bs4(html: str | bytes) -> tuple:
+    soup = BeautifulSoup(html, "html.parser")
+    label = soup.find("div", class_="contentlabel")
+    project_text = label.text if label else None
+
+    pi_listings = []
+    for head in soup.find_all("div", class_="headinggrid"):
+        pigrid = head.find_next("div", class_="pigrid")
+        pi_listings.append(
+            (head.text, [div.text for div in pigrid.find_all("div")] if pigrid else [])
+        )
+
+    publications = []
+    for publication in soup.find_all("div", class_="publistgrid"):
+        href = None
+        links = publication.find_next("div", class_="pubmedlinksgrid")
+        pmid_tag = links.find("div", class_="showlinkpmid") if links else None
+        anchor = pmid_tag.find("a", href=True) if pmid_tag else None
+        if anchor:
+            href = anchor["href"]
+        publications.append((publication.text, href))
+    return project_text, pi_listings, publications
+
+
+def parse_report(html: str | bytes, parser: str = "lxml") -> dict:
+    """
+    Parse the project code, investigators and publications of a report.
+
+    Not all publications have a PubMedID, and not all have a DOI (even if
+    one exists), so either may be an empty string.
+
+    Args:
+        html (str | bytes): Report page
+        parser (str): "lxml", or "html.parser" for BeautifulSoup
+
+    Returns:
+        dict: "project" (str or None), "pis" (list of names) and
+        "publications" (list of (PMID, DOI) tuples)
+    """
+    if parser == "lxml":
+        project_text, pi_listings, publications = _extract_lxml(html)
+    elif parser == "html.parser":
+        project_text, pi_listings, publications = _extract_bs4(html)
+    else:
+        raise ValueError(f"Unknown parser: {parser}")
+
+    project = None
+    if project_text and len(project_text.split()) > 1:
+        project = project_text.split()[1]
+
+    pis = []
+    for label, names in pi_listings:
+        if PUNCTUATION_RE.sub("", label.strip()) not in PI_LABELS:
+            continue
+        for name in names:
+            name = name.strip()
+            if name and not name.startswith("IRP"):
+                pis.append(name.split("\n")[0].strip())
+
+    pmid_dois = []
+    for text, href in publications:
+        doi_match = DOI_RE.search(text)
+        pmid_match = PMID_RE.search(href) if href else None
+        pmid_dois.append(
+            (
+                pmid_match.group(1) if pmid_match else "",
+                doi_match.group() if doi_match else "",
+            )
+        )
+    return {"project": project, "pis": pis, "publications": pmid_dois}
+
+
+def report_rows(report: dict, ipid: int) -> list[tuple]:
+    """
+    Rows of IPID, PI, PMID, DOI, PROJECT for a parsed report: every
+    publication with a PMID or DOI, once per investigator.
+    """
+    rows = [
+        (int(ipid), pi, int(pmid) if pmid else "", doi, report["project"])
+        for pi in report["pis"]
+        for pmid, doi in report["publications"]
+        if pmid or doi
+    ]
+    # same PI listed twice, or a publication listed twice
+    return list(dict.fromkeys(rows))
@@ -282,3 +282,13 @@ class OddpubMetrics(Base):
     work_id = Column(Integer, ForeignKey("works.id"), nullable=True)
     provenance_id = Column(Integer, ForeignKey("provenance.id"), nullable=True)
     document_id = Column(Integer, ForeignKey("documents.id"), nullable=True)
+
+
+class IntramuralIpid(Base):
+    """Intramural project IDs found per IC and report year (get_ipids.py)."""
+
+    __tablename__ = "intramural_ipids"
+
+    ic = Column(String(16), primary_key=True)
+    year = Column(Integer, primary_key=True, autoincrement=False)
+    ipid = Column(Integer, primary_key=True, autoincrement=False)
@@ -1,7 +1,13 @@
 import logging
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import closing
 from pathlib import Path
+from typing import Iterator
 
 import requests
+from requests.adapters import HTTPAdapter
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import Session
 
 from dsst_etl.models import OddpubMetrics
@@ -22,6 +28,8 @@ class OddpubWrapper:
         work_id: int = None,
         document_id: int = None,
         oddpub_host_api: str = config.ODDPUB_HOST_API,
+        max_workers: int = 4,
+        batch_size: int = 50,
     ):
         """
         Initialize the OddpubWrapper.
@@ -30,71 +38,246 @@ class OddpubWrapper:
             db (Session, optional): SQLAlchemy database session
             work_id (int): ID of the work being processed
             document_id (int): ID of the document being processed
+            max_workers (int): Maximum number of requests in flight at once.
+                A service process runs one oddpub analysis at a time, so
+                more workers only overlap uploads and cache hits unless
+                the service runs several processes
+            batch_size (int): Number of results committed per database batch
         """
         try:
             self.oddpub_host_api = oddpub_host_api
             self.db_session = db_session
             self.work_id = work_id
             self.document_id = document_id
+            self.max_workers = max_workers
+            self.batch_size = batch_size
+            self.http_session = self._create_http_session(max_workers)
             logger.info("Successfully initialized OddpubWrapper")
         except Exception as e:
             logger.error(f"Failed to initialize OddpubWrapper: {str(e)}")
             raise
 
+    @staticmethod
+    def _create_http_session(max_workers: int) -> requests.Session:
+        """
+        Create a keep-alive session whose connection pool fits every worker.
+        """
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
     def process_pdfs(
-        self, pdf_folder: str, force_upload: bool = False
-    ) -> OddpubMetrics:
+        self, pdf_folder: str, force_upload: bool = False, resume: bool = False
+    ) -> int:
         """
         Process PDFs through the complete ODDPub workflow and store results in database.
 
         Args:
             pdf_folder (str): Path to folder containing PDF files
             force_upload (bool): Skip confirmation prompt if True (-y flag)
+            resume (bool): Skip documents that already have ODDPub results
+
+        Returns:
+            int: Number of results uploaded to the database
+        """
+        pdf_files = sorted(Path(pdf_folder).glob("*.pdf"))
+        if resume:
+            pdf_files = self._filter_scored(pdf_files)
+        return self._process_files(pdf_files, "oddpub", force_upload)
+
+    def process_texts(
+        self, text_folder: str, force_upload: bool = False, resume: bool = False
+    ) -> int:
+        """
+        Process pre-extracted text (e.g. from scripts/pdfs_to_text.py) through
+        ODDPub, skipping the PDF conversion step on the service.
+
+        Args:
+            text_folder (str): Path to folder containing .txt or .txt.gz files
+            force_upload (bool): Skip confirmation prompt if True (-y flag)
+            resume (bool): Skip documents that already have ODDPub results
+
+        Returns:
+            int: Number of results uploaded to the database
+        """
+        text_folder = Path(text_folder)
+        text_files = sorted([*text_folder.glob("*.txt"), *text_folder.glob("*.txt.gz")])
+        if resume:
+            text_files = self._filter_scored(text_files)
+        return self._process_files(text_files, "oddpub/text", force_upload)
+
+    @staticmethod
+    def _article_name(file_path: Path) -> str:
+        """
+        Name the ODDPub service reports as ``article`` for an uploaded file,
+        i.e. the name of the converted text file.
+        """
+        name = file_path.name.removesuffix(".gz")
+        return f"{Path(name).stem}.txt"
+
+    def _filter_scored(self, files: list[Path]) -> list[Path]:
+        """
+        Drop files whose article name already has a row in oddpub_metrics.
+        Resume matches by article name only, since results are not linked
+        to a per-file document.
+        """
+        scored_articles = set(
+            self.db_session.scalars(select(OddpubMetrics.article)).all()
+        )
+        remaining = [
+            file_path
+            for file_path in files
+            if self._article_name(file_path) not in scored_articles
+        ]
+
+        logger.info(
+            f"Resuming: {len(files) - len(remaining)} of {len(files)} files "
+            "already scored"
+        )
+        return remaining
+
+    def _process_files(
+        self, files: list[Path], endpoint: str, force_upload: bool
+    ) -> int:
+        """
+        Send files to the given ODDPub endpoint concurrently and store the
+        results in the database in batches as they arrive. A database error
+        rolls back the session, stops any queued uploads and is re-raised.
+
+        Args:
+            files (list[Path]): Files to upload to the ODDPub service
+            endpoint (str): Service endpoint, relative to the host API
+            force_upload (bool): Skip confirmation prompt if True (-y flag)
 
         Returns:
-            OddpubMetrics: Results of open data analysis
+            int: Number of results uploaded to the database
         """
+        if not files:
+            logger.warning("No files to process")
+            return 0
+
+        # Results are streamed into the database, so confirm up front
+        if not force_upload:
+            confirm = input(
+                f"\nDo you want to process {len(files)} files and upload the "
+                "results to the database? (y/N): "
+            )
+            if confirm.lower() != "y":
+                logger.info("Database upload cancelled by user")
+                return 0
+
+        uploaded = 0
+        failed = 0
+        batch = []
         try:
-            results = []
-            # Iterate over each PDF file in the folder
-            for pdf_file in Path(pdf_folder).glob("*.pdf"):
-                logger.info(f"Processing {pdf_file.name}...")
-                with open(pdf_file, "rb") as f:
-                    response = requests.post(
-                        f"{self.oddpub_host_api}/oddpub", files={"file": f}
-                    )
-                    response.raise_for_status()
-
-                    r_result = response.json()
-                    results.append((pdf_file.name, r_result))
-
-            # Display results summary
-            logger.info("Results Summary:")
-            for filename, result in results:
-                logger.info(f"\n{filename}:")
-                for key, value in result.items():
-                    logger.info(f"  {key}: {value}")
-
-            # Ask for confirmation before database upload
-            if not force_upload:
-                confirm = input(
-                    "\nDo you want to upload these results to the database? (y/N): "
-                )
-                if confirm.lower() != "y":
-                    logger.info("Database upload cancelled by user")
-                    return None
-
-            # Upload to database
-            for _, r_result in results:
-                oddpub_metrics = OddpubMetrics(**r_result)
-                oddpub_metrics.work_id = self.work_id
-                oddpub_metrics.document_id = self.document_id
-                self.db_session.add(oddpub_metrics)
-
-            self.db_session.commit()
-            logger.info(f"Successfully processed and uploaded {len(results)} files")
-            return oddpub_metrics
+            with closing(self._iter_results(files, endpoint)) as results:
+                for file_path, r_results in results:
+                    if r_results is None:
+                        failed += 1
+                        continue
 
+                    # The service returns one row per article it processed
+                    if isinstance(r_results, dict):
+                        r_results = [r_results]
+                    logger.info(f"\n{file_path.name}:")
+                    for r_result in r_results:
+                        for key, value in r_result.items():
+                            logger.info(f"  {key}: {value}")
+
+                    batch.extend(r_results)
+                    if len(batch) >= self.batch_size:
+                        uploaded += self._upload_batch(batch)
+                        batch = []
+
+            uploaded += self._upload_batch(batch)
         except Exception as e:
-            logger.error(f"Error in PDF processing workflow: {str(e)}")
+            logger.error(f"Error in ODDPub processing workflow: {str(e)}")
             self.db_session.rollback()
+            raise
+
+        if failed:
+            logger.warning(
+                f"Processed {len(files)} files and uploaded {uploaded} rows "
+                f"({failed} files failed)"
+            )
+        else:
+            logger.info(
+                f"Successfully processed {len(files)} files and uploaded "
+                f"{uploaded} rows"
+            )
+        return uploaded
+
+    def _iter_results(
+        self, files: list[Path], endpoint: str
+    ) -> Iterator[tuple[Path, list[dict] | dict | None]]:
+        """
+        Yield (file, result) pairs in completion order, keeping at most
+        ``max_workers`` requests in flight. Failed requests yield None.
+        Closing the generator cancels uploads that have not started yet.
+        """
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pending = {}
+            try:
+                for file_path in files:
+                    future = executor.submit(self._post_file, file_path, endpoint)
+                    pending[future] = file_path
+                    if len(pending) < self.max_workers:
+                        continue
+
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield self._future_result(pending.pop(future), future)
+
+                for future in list(pending):
+                    yield self._future_result(pending.pop(future), future)
+            finally:
+                # Closed early (e.g. on a database error): drop queued uploads
+                for future in pending:
+                    future.cancel()
+
+    @staticmethod
+    def _future_result(
+        file_path: Path, future
+    ) -> tuple[Path, list[dict] | dict | None]:
+        try:
+            return file_path, future.result()
+        except requests.RequestException as e:
+            logger.error(f"Failed to process {file_path.name}: {str(e)}")
+            return file_path, None
+
+    def _post_file(self, file_path: Path, endpoint: str) -> list[dict] | dict:
+        """Upload a single file to the ODDPub service and return its results."""
+        logger.info(f"Processing {file_path.name}...")
+        with open(file_path, "rb") as f:
+            response = self.http_session.post(
+                f"{self.oddpub_host_api}/{endpoint}", files={"file": f}
+            )
+        response.raise_for_status()
+        return response.json()
+
+    def _upload_batch(self, batch: list[dict]) -> int:
+        """
+        Insert a batch of ODDPub results and commit. Articles that already
+        have a row are skipped (ON CONFLICT DO NOTHING) so reruns are safe.
+        """
+        if not batch:
+            return 0
+
+        rows = [
+            {**r_result, "work_id": self.work_id, "document_id": self.document_id}
+            for r_result in batch
+        ]
+        stmt = (
+            insert(OddpubMetrics)
+            .values(rows)
+            .on_conflict_do_nothing(index_elements=[OddpubMetrics.article])
+        )
+        inserted = self.db_session.execute(stmt).rowcount
+        self.db_session.commit()
+        logger.info(
+            f"Committed batch of {inserted} results "
+            f"({len(batch) - inserted} already present)"
+        )
+        return inserted
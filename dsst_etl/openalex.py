@@ -0,0 +1,321 @@
+"""
+Asynchronous client for the OpenAlex works API.
+
+OpenAlex's polite pool (requests carrying a ``mailto``) allows at most 10
+requests per second and 100,000 per day, so requests are sent through a
+shared token bucket over a single keep-alive connection pool.
+
+Harvested works are written with :class:`WorksPartWriter` in the layout of
+an OpenAlex snapshot (``works/*.gz``), which openalex_flatten_works.py reads.
+"""
+
+import asyncio
+import gzip
+import json
+import os
+import zlib
+from pathlib import Path
+from typing import Awaitable, Callable, Iterable
+
+from dsst_etl import logger
+from dsst_etl.harvest import TokenBucket, create_session, fetch
+from dsst_etl.http_cache import ResponseCache
+
+OPENALEX_API = "https://api.openalex.org"
+POLITE_POOL_RATE = 10.0
+# OR-filters accept up to 50 values, and a page holds at most 200 works
+MAX_FILTER_VALUES = 50
+MAX_PER_PAGE = 200
+PMID_PREFIX = "https://pubmed.ncbi.nlm.nih.gov/"
+DOI_PREFIX = "https://doi.org/"
+
+# Called with the requested id and the work, or None if it was not found
+ResultCallback = Callable[[str, dict | None], Awaitable[None] | None]
+
+
+class OpenAlexHarvester:
+    """
+    Fetch OpenAlex works concurrently while respecting the API rate limit.
+    """
+
+    def __init__(
+        self,
+        mailto: str | None = None,
+        user_agent: str | None = None,
+        base_url: str = OPENALEX_API,
+        concurrency: int = 10,
+        rate: float = POLITE_POOL_RATE,
+        max_retries: int = 5,
+        cache: ResponseCache | None = None,
+    ):
+        """
+        Args:
+            mailto (str, optional): Contact email, required for the polite pool
+            user_agent (str, optional): User-Agent header sent with requests
+            base_url (str): OpenAlex API root, overridable for local testing
+            concurrency (int): Maximum number of requests in flight
+            rate (float): Maximum number of requests per second
+            max_retries (int): Retries for 429/5xx responses and errors
+            cache (ResponseCache, optional): On-disk cache for responses
+        """
+        self.base_url = base_url.rstrip("/")
+        self.params = {"mailto": mailto} if mailto else {}
+        self.headers = {"User-Agent": user_agent} if user_agent else None
+        self.concurrency = concurrency
+        self.bucket = TokenBucket(rate)
+        self.max_retries = max_retries
+        self.cache = cache
+
+    async def _get(self, session, path: str, params: dict | None = None):
+        status, body = await fetch(
+            session,
+            f"{self.base_url}/{path}",
+            self.bucket,
+            params={**self.params, **(params or {})},
+            max_retries=self.max_retries,
+            cache=self.cache,
+        )
+        if status == 200:
+            return json.loads(body)
+        if status != 404:
+            logger.error(f"OpenAlex request for {path} failed with {status}")
+        return None
+
+    async def _fetch_single(self, session, kind: str, id_: str) -> dict | None:
+        path = f"works/pmid:{id_}" if kind == "pmid" else f"works/{DOI_PREFIX}{id_}"
+        return await self._get(session, path)
+
+    async def _fetch_batch(
+        self, session, kind: str, ids: list[str]
+    ) -> dict[str, dict | None]:
+        """
+        Look up a batch of ids with one OR-filter query, then fall back to
+        single lookups for ids the filter did not return.
+        """
+        works = {}
+        if len(ids) > 1:
+            page = await self._get(
+                session,
+                "works",
+                {"filter": f"{kind}:{'|'.join(ids)}", "per-page": MAX_PER_PAGE},
+            )
+            for work in (page or {}).get("results", []):
+                if (key := work_key(work, kind)) in ids:
+                    works[key] = work
+
+        for id_ in ids:
+            if id_ not in works:
+                works[id_] = await self._fetch_single(session, kind, id_)
+        return works
+
+    async def harvest_pmids(
+        self, pmids: Iterable[str], on_result: ResultCallback, batch_size: int = 1
+    ) -> None:
+        """
+        Look up each PMID and pass the work to ``on_result`` as soon as it
+        arrives. Works are not accumulated, so memory stays constant.
+
+        Args:
+            pmids (Iterable[str]): PubMed IDs to look up
+            on_result (ResultCallback): Called with (pmid, work or None)
+            batch_size (int): PMIDs per OR-filter request (at most 50), or 1
+                for one request per PMID
+        """
+        await self._harvest("pmid", map(normalize_pmid, pmids), on_result, batch_size)
+
+    async def harvest_dois(
+        self, dois: Iterable[str], on_result: ResultCallback, batch_size: int = 1
+    ) -> None:
+        """
+        Look up each DOI, see :meth:`harvest_pmids`. DOIs are passed to
+        ``on_result`` lower-cased and without the https://doi.org/ prefix.
+        """
+        await self._harvest("doi", map(normalize_doi, dois), on_result, batch_size)
+
+    async def _harvest(
+        self,
+        kind: str,
+        ids: Iterable[str],
+        on_result: ResultCallback,
+        batch_size: int,
+    ) -> None:
+        batch_size = max(1, min(batch_size, MAX_FILTER_VALUES))
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+
+        async with create_session(self.concurrency, self.headers) as session:
+
+            async def worker():
+                while (batch := await queue.get()) is not None:
+                    try:
+                        works = await self._fetch_batch(session, kind, batch)
+                    except Exception as e:
+                        logger.error(f"OpenAlex request for {kind} {batch} failed: {e}")
+                        works = {}
+                    for id_ in batch:
+                        result = on_result(id_, works.get(id_))
+                        if asyncio.iscoroutine(result):
+                            await result
+
+            workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+            batch = []
+            for id_ in dict.fromkeys(ids):
+                batch.append(id_)
+                if len(batch) == batch_size:
+                    await queue.put(batch)
+                    batch = []
+            if batch:
+                await queue.put(batch)
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+
+
+def normalize_pmid(pmid) -> str:
+    return str(pmid).removeprefix(PMID_PREFIX)
+
+
+def normalize_doi(doi: str) -> str:
+    return doi.strip().lower().removeprefix(DOI_PREFIX)
+
+
+def work_key(work: dict, kind: str) -> str | None:
+    """Return the work's PMID or DOI in the form used for lookups."""
+    if kind == "pmid":
+        pmid = (work.get("ids") or {}).get("pmid")
+        return normalize_pmid(pmid) if pmid else None
+    doi = work.get("doi")
+    return normalize_doi(doi) if doi else None
+
+
+class WorksPartWriter:
+    """
+    Stream works into rotating gzip JSONL part files with an id checkpoint.
+
+    Every ``flush_every`` records the current part is sync-flushed and the
+    ids written since the last flush are appended to the checkpoint, so the
+    checkpoint only lists ids whose work is readable on disk. A part being
+    written is named ``*.gz.partial`` and renamed when complete; a partial
+    part left by a crash is salvaged on the next start, keeping only
+    checkpointed records.
+    """
+
+    def __init__(
+        self,
+        works_dir: Path,
+        checkpoint_file: Path,
+        records_per_part: int = 10000,
+        flush_every: int = 100,
+    ):
+        """
+        Args:
+            works_dir (Path): Directory for the part_NNNN.gz files
+            checkpoint_file (Path): File listing the ids already written
+            records_per_part (int): Records per part before rotating
+            flush_every (int): Records between flushes and checkpoint updates
+        """
+        self.works_dir = Path(works_dir)
+        self.checkpoint_file = Path(checkpoint_file)
+        self.records_per_part = records_per_part
+        self.flush_every = flush_every
+        self.works_dir.mkdir(parents=True, exist_ok=True)
+
+        self.done_ids = self.read_checkpoint(self.checkpoint_file)
+        for partial in sorted(self.works_dir.glob("*.gz.partial")):
+            self._salvage(partial)
+
+        existing = [
+            int(part.name.removeprefix("part_").removesuffix(".gz"))
+            for part in self.works_dir.glob("part_*.gz")
+        ]
+        self._part_number = max(existing, default=-1)
+        self._part = None
+        self._part_records = 0
+        self._pending_ids: list[str] = []
+        self._checkpoint = open(self.checkpoint_file, "a")
+
+    @staticmethod
+    def read_checkpoint(checkpoint_file: Path) -> set[str]:
+        if not Path(checkpoint_file).exists():
+            return set()
+        with open(checkpoint_file) as f:
+            return {line.strip() for line in f if line.strip()}
+
+    def _part_path(self, number: int) -> Path:
+        return self.works_dir / f"part_{number:04d}.gz"
+
+    def _salvage(self, partial: Path) -> None:
+        """Rewrite the readable, checkpointed records of an unfinished part."""
+        lines = []
+        try:
+            with gzip.open(partial, "rt", encoding="utf-8") as f:
+                for line in f:
+                    if not line.endswith("\n"):
+                        break
+                    work = json.loads(line)
+                    keys = {
+                        f"{kind}:{work_key(work, kind)}" for kind in ("pmid", "doi")
+                    }
+                    if keys & self.done_ids:
+                        lines.append(line)
+        except (EOFError, zlib.error, json.JSONDecodeError):
+            pass
+
+        if lines:
+            salvaged = partial.with_name(partial.name.removesuffix(".partial"))
+            with gzip.open(salvaged, "wt", encoding="utf-8") as f:
+                f.writelines(lines)
+        partial.unlink()
+        logger.info(f"Salvaged {len(lines)} records from {partial}")
+
+    def _rotate(self) -> None:
+        self._close_part()
+        self._part_number += 1
+        path = self._part_path(self._part_number)
+        self._part = gzip.open(f"{path}.partial", "wb")
+        self._part_records = 0
+
+    def _close_part(self) -> None:
+        if self._part is None:
+            return
+        self.flush()
+        self._part.close()
+        path = self._part_path(self._part_number)
+        os.replace(f"{path}.partial", path)
+        self._part = None
+
+    def write(self, id_: str, json_line: str) -> None:
+        """
+        Write one work, serialized as a JSON line, harvested for ``id_``
+        (e.g. ``pmid:123``).
+        """
+        if self._part is None or self._part_records >= self.records_per_part:
+            self._rotate()
+        if not json_line.endswith("\n"):
+            json_line += "\n"
+        self._part.write(json_line.encode("utf-8"))
+        self._part_records += 1
+        self._pending_ids.append(id_)
+        if len(self._pending_ids) >= self.flush_every:
+            self.flush()
+
+    def flush(self) -> None:
+        """Make written works readable on disk, then checkpoint their ids."""
+        if self._part is not None:
+            # GzipFile.flush does a zlib sync flush of the compressed stream
+            self._part.flush()
+            os.fsync(self._part.fileobj.fileno())
+        if self._pending_ids:
+            self._checkpoint.writelines(f"{id_}\n" for id_ in self._pending_ids)
+            self._checkpoint.flush()
+            self.done_ids.update(self._pending_ids)
+            self._pending_ids = []
+
+    def close(self) -> None:
+        self._close_part()
+        self._checkpoint.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,271 @@
+"""
+Batched client for the PubMed E-utilities efetch and esummary endpoints.
+
+Both accept hundreds of ids per request, and NCBI allows 10 requests per
+second with an API key (3 without), so PMIDs are fetched in batches by a
+few threads sharing one rate limiter and keep-alive session.
+"""
+
+import io
+import json
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Iterable
+
+import pandas as pd
+import requests
+
+from dsst_etl import logger
+from dsst_etl.harvest import RETRY_STATUSES, TokenBucket, retry_delay
+
+EFETCH_URL = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi"
+ESUMMARY_URL = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esummary.fcgi"
+MAX_EFETCH_IDS = 200
+API_KEY_RATE = 10.0
+DEFAULT_RATE = 3.0
+NON_ARTICLE_TYPES = ("Review", "Comment", "Editorial", "Published Erratum")
+
+
+def parse_publication_types(xml: bytes) -> dict[str, dict[str, str]]:
+    """
+    Parse a PubmedArticleSet incrementally.
+
+    Returns:
+        dict[str, dict[str, str]]: PMID to {publication type UI: name}, the
+        format of metapub's ``PubMedArticle.publication_types``
+    """
+    publication_types = {}
+    for _, elem in ET.iterparse(io.BytesIO(xml), events=("end",)):
+        if elem.tag not in ("PubmedArticle", "PubmedBookArticle"):
+            continue
+        pmid = elem.findtext(".//PMID")
+        if pmid:
+            publication_types[pmid.strip()] = {
+                pt.get("UI"): pt.text
+                for pt in elem.iterfind(".//PublicationTypeList/PublicationType")
+            }
+        # free the parsed article, keeping memory flat over the batch
+        elem.clear()
+    return publication_types
+
+
+def parse_summaries(data: bytes) -> dict[str, dict[str, str]]:
+    """
+    Parse an ESummary JSON response.
+
+    Returns:
+        dict[str, dict[str, str]]: PMID to {"title", "journal"}, where
+        journal is the abbreviated source, as metapub's
+        ``PubMedArticle.journal``. Ids ESummary reports an error for are
+        left out.
+    """
+    result = json.loads(data).get("result", {})
+    return {
+        uid: {"title": result[uid]["title"], "journal": result[uid]["source"]}
+        for uid in result.get("uids", [])
+        if "error" not in result.get(uid, {"error": None})
+    }
+
+
+class PubMedClient:
+    """
+    Fetch PubMed records in batches with concurrent, rate-limited requests.
+    """
+
+    def __init__(
+        self,
+        api_key: str | None = None,
+        email: str | None = None,
+        session: requests.Session | None = None,
+        rate: float | None = None,
+        concurrency: int = 3,
+        max_retries: int = 5,
+    ):
+        """
+        Args:
+            api_key (str, optional): NCBI API key, raises the rate limit
+            email (str, optional): Contact email sent with requests
+            session (requests.Session, optional): Session for the requests,
+                e.g. a :class:`dsst_etl.http_cache.CachedSession`
+            rate (float, optional): Requests per second, defaults to the
+                NCBI limit for the key
+            concurrency (int): Requests in flight
+            max_retries (int): Retries of a failed request
+        """
+        self.params = {"db": "pubmed", "tool": "dsst_etl"}
+        if api_key:
+            self.params["api_key"] = api_key
+        if email:
+            self.params["email"] = email
+        self.session = session or requests.Session()
+        self.bucket = TokenBucket(rate or (API_KEY_RATE if api_key else DEFAULT_RATE))
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+
+    def _get(self, url: str, params: dict) -> requests.Response:
+        """GET an E-utilities endpoint, retrying throttled or failed calls."""
+        params = {**self.params, **params}
+        attempt = 0
+        while True:
+            self.bucket.wait()
+            try:
+                response = self.session.get(url, params=params, timeout=60)
+                if response.status_code not in RETRY_STATUSES:
+                    response.raise_for_status()
+                    self.bucket.reward()
+                    return response
+                retry_after = response.headers.get("Retry-After")
+                if response.status_code == 429:
+                    self.bucket.penalize()
+                error = requests.HTTPError(f"HTTP {response.status_code}")
+            except (requests.ConnectionError, requests.Timeout) as e:
+                retry_after, error = None, e
+            if attempt >= self.max_retries:
+                raise error
+            attempt += 1
+            time.sleep(retry_delay(attempt, retry_after))
+
+    def efetch(self, pmids: list[str]) -> bytes:
+        """Fetch the PubmedArticleSet XML of up to 200 PMIDs."""
+        return self._get(EFETCH_URL, {"retmode": "xml", "id": ",".join(pmids)}).content
+
+    def esummary(self, pmids: list[str]) -> bytes:
+        """Fetch the ESummary JSON of up to 200 PMIDs."""
+        return self._get(
+            ESUMMARY_URL, {"retmode": "json", "id": ",".join(pmids)}
+        ).content
+
+    def _fetch_batches(
+        self,
+        pmids: Iterable,
+        request: Callable[[list[str]], bytes],
+        parse: Callable[[bytes], dict],
+        batch_size: int,
+        on_batch: Callable[[dict], None] | None,
+        rounds: int,
+    ) -> tuple[dict, list[str]]:
+        """
+        Run ``request`` over batches of PMIDs from a thread pool, retrying
+        ids missing from the parsed responses in up to ``rounds`` passes.
+        """
+        batch_size = max(1, min(batch_size, MAX_EFETCH_IDS))
+        pending = list(dict.fromkeys(str(pmid) for pmid in pmids))
+        results: dict = {}
+
+        for round_ in range(rounds):
+            if not pending:
+                break
+            if round_:
+                logger.info(f"Retrying {len(pending)} PMIDs")
+            batches = [
+                pending[i : i + batch_size] for i in range(0, len(pending), batch_size)
+            ]
+            with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                futures = {executor.submit(request, batch): batch for batch in batches}
+                for future in as_completed(futures):
+                    try:
+                        parsed = parse(future.result())
+                    except (requests.RequestException, ET.ParseError, ValueError) as e:
+                        logger.error(
+                            f"{request.__name__} of {len(futures[future])} PMIDs "
+                            f"failed: {e}"
+                        )
+                        continue
+                    results.update(parsed)
+                    if on_batch:
+                        on_batch(parsed)
+            pending = [pmid for pmid in pending if pmid not in results]
+
+        return results, pending
+
+    def fetch_publication_types(
+        self,
+        pmids: Iterable,
+        batch_size: int = MAX_EFETCH_IDS,
+        on_batch: Callable[[dict[str, dict[str, str]]], None] | None = None,
+        rounds: int = 3,
+    ) -> tuple[dict[str, dict[str, str]], list[str]]:
+        """
+        Fetch the publication types of every PMID. Ids missing from a
+        response, or in a batch whose request failed, are retried in up to
+        ``rounds`` passes; the rest are returned as failed.
+
+        Args:
+            pmids (Iterable): PubMed IDs
+            batch_size (int): Ids per efetch request, at most 200
+            on_batch (Callable, optional): Called with each parsed batch
+            rounds (int): Passes over the ids still missing
+
+        Returns:
+            tuple[dict[str, dict[str, str]], list[str]]: Publication types
+            by PMID, and the PMIDs that could not be fetched
+        """
+        return self._fetch_batches(
+            pmids, self.efetch, parse_publication_types, batch_size, on_batch, rounds
+        )
+
+    def fetch_summaries(
+        self,
+        pmids: Iterable,
+        batch_size: int = MAX_EFETCH_IDS,
+        on_batch: Callable[[dict[str, dict[str, str]]], None] | None = None,
+        rounds: int = 3,
+    ) -> tuple[dict[str, dict[str, str]], list[str]]:
+        """
+        Fetch the title and journal of every PMID with ESummary, batched and
+        retried like :meth:`fetch_publication_types`.
+
+        Returns:
+            tuple[dict[str, dict[str, str]], list[str]]: {"title", "journal"}
+            by PMID, and the PMIDs that could not be fetched
+        """
+        return self._fetch_batches(
+            pmids, self.esummary, parse_summaries, batch_size, on_batch, rounds
+        )
+
+
+def publication_types_long(
+    publication_types: dict[str, dict[str, str]],
+) -> pd.DataFrame:
+    """
+    Flatten fetched publication types into one (PMID, publication_type) row
+    per pair, with the type stored as a categorical.
+
+    Args:
+        publication_types (dict[str, dict[str, str]]): As returned by
+            :meth:`PubMedClient.fetch_publication_types`
+
+    Returns:
+        pd.DataFrame: Columns PMID (Int64) and publication_type (category)
+    """
+    pairs = [
+        (pmid, name)
+        for pmid, types in publication_types.items()
+        for name in types.values()
+    ]
+    long_df = pd.DataFrame(pairs, columns=["PMID", "publication_type"])
+    long_df["PMID"] = pd.to_numeric(long_df["PMID"]).astype("Int64")
+    long_df["publication_type"] = long_df["publication_type"].astype("category")
+    return long_df.drop_duplicates(ignore_index=True)
+
+
+def one_hot_publication_types(long_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Pivot the long table into one bool column per publication type and one
+    row per PMID, with PMID as the last column.
+    """
+    one_hot_df = pd.crosstab(
+        long_df["PMID"], long_df["publication_type"].astype(str)
+    ).astype(bool)
+    one_hot_df.columns.name = None
+    return one_hot_df.reset_index()[[*one_hot_df.columns, "PMID"]]
+
+
+def non_article_pmids(
+    long_df: pd.DataFrame, exclude: Iterable[str] = NON_ARTICLE_TYPES
+) -> pd.Series:
+    """PMIDs in the long table tagged with any of the ``exclude`` types."""
+    return long_df.loc[
+        long_df["publication_type"].isin(exclude), "PMID"
+    ].drop_duplicates(ignore_index=True)
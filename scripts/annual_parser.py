@@ -1,27 +1,116 @@
 import re
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from typing import Iterable, Iterator
 
 from requests import Session
+from requests.adapters import HTTPAdapter
 from requests.models import Response
 from word2number import w2n  # type: ignore
 
+from dsst_etl.harvest import TokenBucket
+
+"""
+Searches the intramural annual reports by IC and year
+The site asks "The sum of 3 + five =" before it allows a search
+AnnualReportClient answers once per session and again only when a response
+shows the question, so concurrent searches share one answered session
+"""
+
 URL: str = "https://intramural.nih.gov/search/index.taf"
+CHECK_URL: str = "https://intramural.nih.gov/search/allreports.taf"
+SEARCH_URL: str = (
+    "https://intramural.nih.gov/search/allreports.taf?_function=search"
+)
 QUESTION_RE: re.Pattern = re.compile(r"The sum of \d+ \+ .+ =")
 
 
-def parse_annual_ic_pubs(serachyear: str, ic: str) -> Response:
-    session: Session = Session()
-    response: Response = session.get(url=URL)
-    found: list[str] = QUESTION_RE.findall(response.text)
+def solve_challenge(text: str) -> str:
+    """Answer the sum question on a page"""
+    found: list[str] = QUESTION_RE.findall(text)
     first_number: int = int(found[0].split()[-4])
     second_number: int = w2n.word_to_num(found[0].split()[-2])
-    solution: str = str(first_number + second_number)
-    post_payload: dict = {"showheader": "Y", "from": "", "checknum": solution}
-    _: Response = session.post(
-        "https://intramural.nih.gov/search/allreports.taf", data=post_payload
-    )
-    search_payload: dict = {"searchyear": serachyear, "ic": ic}
-    response_3: Response = session.post(
-        "https://intramural.nih.gov/search/allreports.taf?_function=search",
-        data=search_payload,
-    )
-    return response_3
+    return str(first_number + second_number)
+
+
+class AnnualReportClient:
+    """Search annual reports over one session, from several threads"""
+
+    def __init__(
+        self,
+        session: Session | None = None,
+        workers: int = 8,
+        rate: float = 5.0,
+        max_solves: int = 3,
+    ):
+        self.session: Session = session or Session()
+        # one pooled connection per worker
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.session.mount("https://", adapter)
+        self.workers = workers
+        self.bucket = TokenBucket(rate)
+        self.max_solves = max_solves
+        self._lock = threading.Lock()
+        # bumped on every answer, 0 until the first one
+        self._generation = 0
+
+    def _request(self, method: str, url: str, **kwargs) -> Response:
+        self.bucket.wait()
+        return self.session.request(method, url, timeout=60, **kwargs)
+
+    def _solve(self, seen_generation: int) -> None:
+        # threads that saw the same expired session wait for one answer
+        with self._lock:
+            if self._generation != seen_generation:
+                return
+            response: Response = self._request("GET", URL)
+            response.raise_for_status()
+            post_payload: dict = {
+                "showheader": "Y",
+                "from": "",
+                "checknum": solve_challenge(response.text),
+            }
+            self._request("POST", CHECK_URL, data=post_payload)
+            self._generation += 1
+
+    def search(self, searchyear: str, ic: str) -> Response:
+        """All reports of an IC for a year"""
+        search_payload: dict = {"searchyear": searchyear, "ic": ic}
+        solves = 0
+        while True:
+            generation = self._generation
+            if generation:
+                response: Response = self._request(
+                    "POST", SEARCH_URL, data=search_payload
+                )
+                if not QUESTION_RE.search(response.text):
+                    return response
+                # the server asked again, the session expired
+            if solves == self.max_solves:
+                raise RuntimeError(
+                    f"Challenge not accepted after {solves} answers"
+                )
+            solves += 1
+            self._solve(generation)
+
+    def search_many(
+        self, searches: Iterable[tuple[str, str]]
+    ) -> Iterator[tuple[tuple[str, str], Future]]:
+        """
+        Run (searchyear, ic) searches concurrently
+        Yields each search with its finished future, in completion order
+        """
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {
+                executor.submit(self.search, searchyear, ic): (searchyear, ic)
+                for searchyear, ic in searches
+            }
+            for future in as_completed(futures):
+                yield futures[future], future
+
+
+def parse_annual_ic_pubs(
+    serachyear: str, ic: str, client: AnnualReportClient | None = None
+) -> Response:
+    """Search one IC and year, on a new session unless a client is given"""
+    return (client or AnnualReportClient()).search(serachyear, ic)
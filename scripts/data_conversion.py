@@ -1,37 +1,72 @@
+import csv
+import os
 from pathlib import Path
+
 import pandas as pd
 from dotenv import load_dotenv
-load_dotenv()  # Import NCBI_API_KEY before loading PubMedFetcher
-from metapub.pubmedfetcher import PubMedFetcher
+
+from dsst_etl.http_cache import CachedSession
+from dsst_etl.pubmed import PubMedClient
+
+"""
+Adds the title and journal of each PMID in the articles csv
+PMIDs are summarized with ESummary in batches of 200, a few requests at a time
+each batch is appended to the output csv as soon as it arrives
+rerunning skips the PMIDs already in the output, so an interrupted run resumes
+PMIDs that could not be fetched go to the error file and are retried next run
+"""
+
 paths = [
-    ['2023data/pmids2023_articles.csv', '2023data/title_journal2023.csv'],
-    ['data/pmids_articles.csv', 'data/title_journal19-22.csv']
+    ["2023data/pmids2023_articles.csv", "2023data/title_journal2023.csv"],
+    ["data/pmids_articles.csv", "data/title_journal19-22.csv"],
 ]
-df = pd.read_csv(paths[1][0])
-pmids = df['PMID'].astype('Int64').unique()
-data = {
-    'pmid': [],
-    'title': [],
-    'journal': []
-}
-
-for i, pmid in enumerate(pmids):
-    print(f'{i+1} of {len(pmids)}')
-    try:
-        pma = PubMedFetcher().article_by_pmid(pmid)
-    except:
-        print('******')
+INPUT_FILE_PATH = Path(paths[1][0])
+OUTPUT_FILE_PATH = Path(paths[1][1])
+ERROR_FILE_PATH = OUTPUT_FILE_PATH.with_name(
+    f"{OUTPUT_FILE_PATH.stem}_error.txt"
+)
+COLUMNS = ["pmid", "title", "journal"]
+
+load_dotenv()  # Import NCBI_API_KEY and NCBI_EMAIL
+
+df = pd.read_csv(INPUT_FILE_PATH)
+pmids = df["PMID"].dropna().astype("Int64").unique()
+
+# a header-only output resumes with nothing done, an empty one starts over
+resume = OUTPUT_FILE_PATH.exists() and OUTPUT_FILE_PATH.stat().st_size > 0
+done = set()
+if resume:
+    done = set(pd.read_csv(OUTPUT_FILE_PATH, usecols=["pmid"])["pmid"])
+todo = [pmid for pmid in pmids if pmid not in done]
+print(f"{len(done)} PMIDs already converted, {len(todo)} to go")
+
+client = PubMedClient(
+    api_key=os.getenv("NCBI_API_KEY"),
+    email=os.getenv("NCBI_EMAIL"),
+    session=CachedSession(),
+)
+
+with open(OUTPUT_FILE_PATH, "a", newline="") as f:
+    writer = csv.writer(f)
+    if not resume:
+        writer.writerow(COLUMNS)
+
+    converted = len(done)
+
+    def checkpoint(batch):
+        global converted
+        writer.writerows(
+            [pmid, summary["title"], summary["journal"]]
+            for pmid, summary in batch.items()
+        )
+        f.flush()
+        converted += len(batch)
+        print(f"{converted} of {len(pmids)}")
+
+    _, failed = client.fetch_summaries(todo, on_batch=checkpoint)
+
+with open(ERROR_FILE_PATH, "a") as error_file:
+    for pmid in failed:
+        print("******")
         print(pmid)
-        data['pmid'].append(pmid)
-        data['title'].append('')
-        data['journal'].append('')
-        continue
-    data['pmid'].append(pmid)
-    data['title'].append(pma.title)
-    data['journal'].append(pma.journal)
-    #print(pma.title)
-    #print(pma.journal)
-    #print('**************************')
-
-df_tj = pd.DataFrame(data)
-df_tj.to_csv(paths[1][1], index=False)
+        error_file.write(f"FINAL FAIL: {pmid}\n")
@@ -1,23 +1,30 @@
+import argparse
 import csv
 import os
 import re
 from pathlib import Path
-from time import sleep
+from typing import Iterable
 
 import requests
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.dialects import postgresql, sqlite
 
-from annual_parser import parse_annual_ic_pubs
+from dsst_etl.models import IntramuralIpid
+
+from annual_parser import AnnualReportClient
 
 """
 Scrapes ipids with post requests
+ICs and years are searched concurrently on one session
 Saves or appends to single csv: IC, YEAR, IPID
+or, with --db-url, to the intramural_ipids table in Postgres or SQLite
+Rows already saved are kept in a set, only new rows are written
 error_file_path only for most recent errors
+Can be imported: scrape_ipids(registry, ics, years)
 """
 data_path = Path("./2024_all_ics")
 csv_file_path = data_path / "ipids.csv"
 error_file_path = data_path / "get_ipids_error.txt"
-# create output folder if it doesn't exist
-os.makedirs(data_path, exist_ok=True)
 
 ICs = [
     "CC",
@@ -50,49 +57,176 @@ ICs = [
 oldest_year_data = 2024
 most_recent_year_data = 2024
 
-# lines that already exist in the CSV
-existing_lines = []
-header = None
-if csv_file_path.exists():
-    with open(csv_file_path, "r") as existing_file:
-        csv_reader = csv.reader(existing_file)
-        header = next(csv_reader, None)
-        for row in csv_reader:
-            existing_lines.append(row)
-
-with open(csv_file_path, "a", newline="") as csv_file:
-    csv_writer = csv.writer(csv_file)
-    if not header:
-        csv_writer.writerow(["IC", "YEAR", "IPID"])
-
-    for ic in ICs:
-        for searchyear in range(oldest_year_data, most_recent_year_data + 1):
-            # line below can be used to only scrape
-            # if data is not in csv already
-            # any(row[:2] == [IC, str(searchyear)] for
-            # row in existing_lines[:2])
-            print(f"Getting IPID {ic} {searchyear}")
-            try:
-                sleep(0.5)
-                response = parse_annual_ic_pubs(str(searchyear), ic)
-                response.raise_for_status()
-
-                ipid_numbers = re.findall(r"ipid=(\d+)", response.text)
-                unique_ipids = list(set(ipid_numbers))
-
-                # add IC, Year, IPID to CSV, avoiding duplicates
-                for ipid in unique_ipids:
-                    row = [ic, str(searchyear), ipid]
-                    if row not in existing_lines:
-                        csv_writer.writerow(row)
-                        existing_lines.append(row)
-                print(f"{ic}: {len(unique_ipids)} IPIDs")
-
-            except requests.exceptions.RequestException as e:
-                print(f"Error for {ic}: {e}")
+IPID_COLUMNS = ["IC", "YEAR", "IPID"]
+
+ipids_table = IntramuralIpid.__table__
+
+
+def ipid_key(ic, year, ipid) -> tuple[str, int, int]:
+    """(IC, YEAR, IPID) with the same types whether read from csv or db"""
+    return str(ic), int(year), int(ipid)
+
+
+class CsvRegistry:
+    """IPIDs in a csv, indexed by a set of (IC, YEAR, IPID)"""
+
+    def __init__(self, path: Path):
+        self.index: set[tuple[str, int, int]] = set()
+        header = None
+        if path.exists():
+            with open(path, "r") as existing_file:
+                csv_reader = csv.reader(existing_file)
+                header = next(csv_reader, None)
+                self.index.update(ipid_key(*row) for row in csv_reader if row)
+        self._file = open(path, "a", newline="")
+        self._writer = csv.writer(self._file)
+        if not header:
+            self._writer.writerow(IPID_COLUMNS)
+
+    def add(self, rows: Iterable[tuple]) -> int:
+        """Append the rows not saved yet, returns how many"""
+        new_rows = {ipid_key(*row) for row in rows} - self.index
+        self._writer.writerows(sorted(new_rows))
+        self._file.flush()
+        self.index.update(new_rows)
+        return len(new_rows)
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class SqlRegistry:
+    """
+    IPIDs in the intramural_ipids table of a Postgres or SQLite db
+    In Postgres the table comes from the Alembic migrations (IntramuralIpid)
+    """
+
+    def __init__(self, db_url: str):
+        self.engine = create_engine(db_url)
+        dialect = self.engine.dialect.name
+        if dialect not in ("postgresql", "sqlite"):
+            raise ValueError(f"Unsupported database: {dialect}")
+        self._insert = (
+            postgresql.insert if dialect == "postgresql" else sqlite.insert
+        )
+        if dialect == "sqlite":
+            # a local registry file, outside the migrated database
+            ipids_table.create(self.engine, checkfirst=True)
+        elif not inspect(self.engine).has_table(ipids_table.name):
+            raise RuntimeError(
+                f"{ipids_table.name} does not exist. "
+                "Please run Alembic migrations."
+            )
+        with self.engine.connect() as conn:
+            self.index: set[tuple[str, int, int]] = {
+                ipid_key(*row) for row in conn.execute(ipids_table.select())
+            }
+
+    def add(self, rows: Iterable[tuple]) -> int:
+        """Insert the rows not saved yet, returns how many"""
+        new_rows = {ipid_key(*row) for row in rows} - self.index
+        if new_rows:
+            # rows another scraper saved meanwhile are skipped by the db
+            statement = self._insert(ipids_table).on_conflict_do_nothing()
+            with self.engine.begin() as conn:
+                conn.execute(
+                    statement,
+                    [
+                        {"ic": ic, "year": year, "ipid": ipid}
+                        for ic, year, ipid in sorted(new_rows)
+                    ],
+                )
+        self.index.update(new_rows)
+        return len(new_rows)
+
+    def close(self) -> None:
+        self.engine.dispose()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def scrape_ipids(
+    registry: CsvRegistry | SqlRegistry,
+    ics: Iterable[str] = ICs,
+    years: Iterable[int] = range(oldest_year_data, most_recent_year_data + 1),
+    client: AnnualReportClient | None = None,
+    error_file_path: Path | None = None,
+) -> int:
+    """Search every IC and year, save new IPIDs, returns how many"""
+    # one answered session, several searches in flight
+    client = client or AnnualReportClient()
+    searches = [(str(searchyear), ic) for ic in ics for searchyear in years]
+    added = 0
+    for (searchyear, ic), future in client.search_many(searches):
+        print(f"Getting IPID {ic} {searchyear}")
+        try:
+            response = future.result()
+            response.raise_for_status()
+
+            unique_ipids = set(re.findall(r"ipid=(\d+)", response.text))
+
+            # add IC, Year, IPID, avoiding duplicates
+            added += registry.add(
+                (ic, searchyear, ipid) for ipid in unique_ipids
+            )
+            print(f"{ic}: {len(unique_ipids)} IPIDs")
+
+        except requests.exceptions.RequestException as e:
+            print(f"Error for {ic}: {e}")
+            if error_file_path:
                 with open(error_file_path, "a") as error_file:
                     error_file.write(f"{ic}\n")
-            except Exception as e:
-                print(f"Error occurred for {ic}: {e}")
+        except Exception as e:
+            print(f"Error occurred for {ic}: {e}")
+            if error_file_path:
                 with open(error_file_path, "a") as error_file:
                     error_file.write(f"{ic}\n")
+    return added
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Scrape intramural project IDs by IC and year"
+    )
+    parser.add_argument("--ics", nargs="+", default=ICs)
+    parser.add_argument("--oldest-year", type=int, default=oldest_year_data)
+    parser.add_argument(
+        "--most-recent-year", type=int, default=most_recent_year_data
+    )
+    parser.add_argument(
+        "--db-url",
+        help=(
+            "SQLAlchemy url to store IPIDs in instead of the csv: a SQLite "
+            "file (created if needed) or a Postgres database migrated with "
+            "alembic upgrade heads"
+        ),
+    )
+    args = parser.parse_args()
+
+    # create output folder if it doesn't exist
+    os.makedirs(data_path, exist_ok=True)
+    registry = (
+        SqlRegistry(args.db_url) if args.db_url else CsvRegistry(csv_file_path)
+    )
+    with registry:
+        added = scrape_ipids(
+            registry,
+            args.ics,
+            range(args.oldest_year, args.most_recent_year + 1),
+            error_file_path=error_file_path,
+        )
+    print(f"{added} new IPIDs, {len(registry.index)} in total")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,16 @@
 import os
 from pathlib import Path
-from time import sleep
 
-import eutils  # type: ignore
 import pandas as pd
 from dotenv import load_dotenv
-from metapub.cache_utils import get_cache_path  # type: ignore
-from metapub.pubmedarticle import PubMedArticle  # type: ignore
+
+from dsst_etl.http_cache import CachedSession
+from dsst_etl.pubmed import (
+    PubMedClient,
+    non_article_pmids,
+    one_hot_publication_types,
+    publication_types_long,
+)
 
 """
 PubMed has a list of types for each publication.
@@ -14,7 +18,14 @@ This code fetches the types of each publication in pmids.csv
 and generates pmids_articles.csv, removing the types:
 ['Review', 'Comment', 'Editorial', 'Published Erratum']
 
-one_hot_types.csv is also produced
+PMIDs are fetched with efetch in batches of 200, a few requests at a time
+ids missing from a response are retried, those that never come back
+are written to the error file
+
+publication_types.parquet holds one (PMID, publication_type) row per pair
+filter it with e.g. publication_type.isin([...]) in one operation
+
+one_hot_types.csv is also produced, pivoted from the long table
 each column is an existing type
 each row is a publication
 the cells are bools indicating which type is a pub
@@ -23,66 +34,40 @@ the cells are bools indicating which type is a pub
 DATA_PATH: Path = Path(r"./2024_all_ics")
 PMID_FILE_PATH: Path = DATA_PATH / "pmids_2024.csv"
 ONE_HOT_FILE_PATH: Path = DATA_PATH / "one_hot_types_2024.csv"
+PUBTYPES_FILE_PATH: Path = DATA_PATH / "publication_types_2024.parquet"
 FILTERED_PMID_FILE_PATH: Path = DATA_PATH / "pmids_articles_2024.csv"
 ERROR_FILE_PATH: Path = DATA_PATH / "get_pmids_articles_error_2024.txt"
-MAX_RETRIES: int = 10
 
-load_dotenv()  # Import NCBI_API_KEY before loading PubMedFetcher
+load_dotenv()  # Import NCBI_API_KEY and NCBI_EMAIL
 
 df = pd.read_csv(PMID_FILE_PATH)
-pubtypes_lst_of_dict = []
-pmids = []
-qs = eutils.QueryService(
-    email=os.getenv("NCBI_EMAIL"),
+client = PubMedClient(
     api_key=os.getenv("NCBI_API_KEY"),
-    cache=get_cache_path(),
+    email=os.getenv("NCBI_EMAIL"),
+    session=CachedSession(),
 )
+unique_pmids = df["PMID"].dropna().astype("Int64").unique()
+fetched = 0
 
-for i, pmid in enumerate(df["PMID"].astype("Int64").unique()):
-    print(f"{i+1} of {len(df['PMID'].unique())} PMIDS")
-    attempts: int = 0
-    retry: bool = True
-    while retry:
-        try:
-            result = qs.efetch({"db": "pubmed", "id": pmid})
-            pma = PubMedArticle(result)
-            sleep(0.1)
-            row = pma.publication_types
-            pubtypes_lst_of_dict.append(row)
-            pmids.append(pmid)
-            assert len(pubtypes_lst_of_dict) == len(pmids)
-            retry = False
-            print("\tsuccess!")
-        except eutils.EutilsNCBIError as e:
-            attempts += 1
-            print("\tretrying...")
-            if attempts == MAX_RETRIES:
-                retry = False
-                with open(ERROR_FILE_PATH, "a") as f:
-                    f.write(f"FINAL FAIL: {pmid}: {e}\n")
-        except eutils.EutilsError as e:
-            with open(ERROR_FILE_PATH, "a") as f:
-                f.write(f"{pmid}: {e}\n")
 
-all_values = set()
-for d in pubtypes_lst_of_dict:
-    all_values.update(d.values())
+def report_progress(batch):
+    global fetched
+    fetched += len(batch)
+    print(f"{fetched} of {len(unique_pmids)} PMIDS")
 
-data = []
-for d in pubtypes_lst_of_dict:
-    row_data = {value: value in d.values() for value in all_values}
-    data.append(row_data)
 
-one_hot_df = pd.DataFrame(data)
-one_hot_df = one_hot_df.fillna(False)
-one_hot_df["PMID"] = pmids
-one_hot_df.to_csv(ONE_HOT_FILE_PATH, index=False)
-
-remove_cols = ["Review", "Comment", "Editorial", "Published Erratum"]
+results, failed = client.fetch_publication_types(
+    unique_pmids, on_batch=report_progress
+)
+with open(ERROR_FILE_PATH, "a") as f:
+    for pmid in failed:
+        f.write(f"FINAL FAIL: {pmid}\n")
 
-# code fails on small test cases where remove_cols values are not present
-remove_cols = list(set(remove_cols).intersection(all_values))
+long_df = publication_types_long(results)
+long_df.to_parquet(PUBTYPES_FILE_PATH, index=False)
+one_hot_publication_types(long_df).to_csv(ONE_HOT_FILE_PATH, index=False)
 
-article_pmid = one_hot_df[~one_hot_df[remove_cols].any(axis=1)]["PMID"]
-opendata_articles = df[df["PMID"].isin(article_pmid)]
+fetched_pmids = df["PMID"].isin(pd.to_numeric(list(results)))
+non_articles = df["PMID"].isin(non_article_pmids(long_df))
+opendata_articles = df[fetched_pmids & ~non_articles]
 opendata_articles.to_csv(FILTERED_PMID_FILE_PATH, index=False)
@@ -0,0 +1,59 @@
+import argparse
+from pathlib import Path
+
+from dsst_etl.intramural import parse_report
+
+from openalex_flatten_benchmark import timed
+
+"""
+Benchmark of the intramural report parsers used by get_pmids.py
+Parses saved report pages with the lxml backend and with BeautifulSoup
+(html.parser), checks they agree and prints reports per second
+Defaults to the test fixtures; point --reports at a directory of saved
+searchview.taf pages for realistic numbers
+"""
+
+FIXTURES = Path(__file__).parent.parent / "tests" / "intramural-test"
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the intramural report parsers"
+    )
+    parser.add_argument(
+        "--reports",
+        type=Path,
+        default=FIXTURES,
+        help="directory of saved report .html files",
+    )
+    parser.add_argument(
+        "-n",
+        "--repeat",
+        type=int,
+        default=200,
+        help="times each report is parsed",
+    )
+    args = parser.parse_args()
+
+    pages = [p.read_bytes() for p in sorted(args.reports.glob("*.html"))]
+    if not pages:
+        parser.error(f"no .html reports in {args.reports}")
+    pages = pages * args.repeat
+    n = len(pages)
+    print(f"{n} reports, {sum(map(len, pages)) / 2**20:.1f} MiB of html")
+
+    results = {
+        backend: timed(
+            backend,
+            lambda: [parse_report(page, backend) for page in pages],
+            n,
+            "reports",
+        )
+        for backend in ("html.parser", "lxml")
+    }
+    if results["lxml"] != results["html.parser"]:
+        print("WARNING: the parsers disagree")
+
+
+if __name__ == "__main__":
+    main()
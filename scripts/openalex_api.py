@@ -1,4 +1,3 @@
-import gzip
 import json
 import os
 import time
@@ -6,20 +5,25 @@ from multiprocessing import Pool
 from pathlib import Path
 
 import pandas as pd
-import requests
 from dotenv import load_dotenv
 
 # Uncomment for single thread debugging
 from tqdm import tqdm
 
+from dsst_etl.http_cache import CachedSession
+from dsst_etl.openalex import WorksPartWriter
+
 # .env variables
 load_dotenv()
 headers = {"User-Agent": os.getenv("USER_AGENT")}
+# responses are cached on disk, so reruns mostly skip the API
+session = CachedSession()
 
 DATA_PATH = Path("./2024_all_ics")
 FILTERED_PMID_FILE_PATH = DATA_PATH / "pmids_articles_2024.csv"
 OUTPUT_FILE_PATH = DATA_PATH / "openalex-snapshot_2024/works"
-jsonOutput_file = OUTPUT_FILE_PATH / "calls.jsonl.gz"
+# ids already written to OUTPUT_FILE_PATH, so reruns only fetch missing PMIDs
+checkpoint_file = DATA_PATH / "openalex-snapshot_2024/works_checkpoint.txt"
 failed_file = DATA_PATH / "openalex_api_error.txt"
 
 # create output folder if it doesn't exist
@@ -43,7 +47,7 @@ def process_pmid(pmid):
         url = pmid_url.format(pmid)
     while retries < max_retries:
         try:
-            response = requests.get(url, headers=headers)
+            response = session.get(url, headers=headers)
             if response.status_code == 200:
                 json_data = response.json()
                 json_line = json.dumps(json_data) + "\n"
@@ -57,7 +61,7 @@ def process_pmid(pmid):
 
     if retries == max_retries:
         print(f"Failed to fetch data for {url} after {max_retries} retries.")
-        with open(failed_file, "w") as failed_calls_file:
+        with open(failed_file, "a") as failed_calls_file:
             failed_calls_file.write(url + "\n")
 
 
@@ -67,16 +71,16 @@ if __name__ == "__main__":
     # with Pool(processes=4) as pool:
     #     results = pool.map(process_pmid, pmids)
 
-    # Uncomment for debugging on single thread
-    results = []
-    for pmid in tqdm(pmids):
-        result = process_pmid(pmid=pmid)
-        results.append(result)
-
-    # Write successful results to the output file
-    with gzip.open(jsonOutput_file, "w") as outfile:
-        for result in results:
+    # Results are streamed into rotating works/part_NNNN.gz files
+    with WorksPartWriter(OUTPUT_FILE_PATH, checkpoint_file) as writer:
+        pending = [
+            pmid
+            for pmid in pmids
+            if not pd.isna(pmid) and f"pmid:{pmid}" not in writer.done_ids
+        ]
+        for pmid in tqdm(pending):
+            result = process_pmid(pmid=pmid)
             if result:
-                outfile.write(result.encode("utf-8"))
+                writer.write(f"pmid:{pmid}", result)
 
     print(f"Process completed. Check {failed_file} for pending calls.")
@@ -0,0 +1,155 @@
+import argparse
+import asyncio
+import json
+import os
+from pathlib import Path
+
+import pandas as pd
+from dotenv import load_dotenv
+from tqdm import tqdm
+
+from dsst_etl.http_cache import DEFAULT_CACHE_DIR, ResponseCache
+from dsst_etl.openalex import (
+    MAX_FILTER_VALUES,
+    OPENALEX_API,
+    POLITE_POOL_RATE,
+    OpenAlexHarvester,
+    WorksPartWriter,
+    normalize_doi,
+)
+
+"""
+Asyncio version of openalex_api.py
+Fetches the OpenAlex work for every PMID (or DOI, when a row has no PMID)
+with concurrent requests over one keep-alive connection pool, rate limited
+to the OpenAlex polite pool
+Ids are grouped into OR-filter queries of up to 50 values; ids a batch does
+not return are retried as single lookups
+Works are streamed into rotating works/part_NNNN.gz files with an id
+checkpoint, so a rerun only fetches the ids that are still missing
+Responses are kept in the shared on-disk HTTP cache unless --no-cache is set
+"""
+
+# .env variables
+load_dotenv()
+
+DATA_PATH = Path("./2024_all_ics")
+FILTERED_PMID_FILE_PATH = DATA_PATH / "pmids_articles_2024.csv"
+OUTPUT_FILE_PATH = DATA_PATH / "openalex-snapshot_2024/works"
+CHECKPOINT_FILE_PATH = DATA_PATH / "openalex-snapshot_2024/works_checkpoint.txt"
+FAILED_FILE_PATH = DATA_PATH / "openalex_api_error.txt"
+MAILTO = "lawrimorejg@nih.gov"
+
+
+def read_ids(pmid_file: Path) -> tuple[list[str], list[str]]:
+    """PMIDs, plus DOIs for the rows that have no PMID."""
+    pmid_df = pd.read_csv(pmid_file)
+    pmid_df["PMID"] = pmid_df["PMID"].astype("Int64")
+    pmids = [str(pmid) for pmid in pmid_df["PMID"].dropna().unique()]
+    dois = []
+    if "DOI" in pmid_df.columns:
+        doi_only = pmid_df[pmid_df["PMID"].isna()]["DOI"].dropna()
+        dois = list(doi_only.astype(str).unique())
+    return pmids, dois
+
+
+async def harvest(
+    pmids: list[str],
+    dois: list[str],
+    output_dir: Path,
+    checkpoint_file: Path,
+    failed_file: Path,
+    batch_size: int,
+    **harvester_kwargs,
+) -> None:
+    harvester = OpenAlexHarvester(
+        user_agent=os.getenv("USER_AGENT"), **harvester_kwargs
+    )
+    with WorksPartWriter(output_dir, checkpoint_file) as writer, open(
+        failed_file, "w"
+    ) as failed:
+        # only fetch ids missing from earlier runs
+        pmids = [pmid for pmid in pmids if f"pmid:{pmid}" not in writer.done_ids]
+        dois = [
+            doi for doi in map(normalize_doi, dois)
+            if f"doi:{doi}" not in writer.done_ids
+        ]
+        progress = tqdm(total=len(pmids) + len(dois))
+
+        def on_result(kind: str):
+            def write(id_: str, work: dict | None) -> None:
+                if work is None:
+                    failed.write(f"{kind}:{id_}\n")
+                else:
+                    writer.write(f"{kind}:{id_}", json.dumps(work))
+                progress.update()
+
+            return write
+
+        await harvester.harvest_pmids(pmids, on_result("pmid"), batch_size)
+        await harvester.harvest_dois(dois, on_result("doi"), batch_size)
+    progress.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Fetch OpenAlex works for PMIDs with asyncio"
+    )
+    parser.add_argument(
+        "-i", "--input", type=Path, default=FILTERED_PMID_FILE_PATH,
+        help="CSV file with a PMID column",
+    )
+    parser.add_argument(
+        "-o", "--output-dir", type=Path, default=OUTPUT_FILE_PATH,
+        help="Directory for the part_NNNN.gz files",
+    )
+    parser.add_argument(
+        "--checkpoint", type=Path, default=CHECKPOINT_FILE_PATH,
+        help="File listing the ids already fetched",
+    )
+    parser.add_argument(
+        "--failed", type=Path, default=FAILED_FILE_PATH,
+        help="File listing PMIDs that could not be fetched",
+    )
+    parser.add_argument("--mailto", default=MAILTO, help="Polite pool email")
+    parser.add_argument("--base-url", default=OPENALEX_API)
+    parser.add_argument(
+        "--concurrency", type=int, default=10, help="Requests in flight"
+    )
+    parser.add_argument(
+        "--rate", type=float, default=POLITE_POOL_RATE, help="Requests per second"
+    )
+    parser.add_argument(
+        "--batch-size", type=int, default=MAX_FILTER_VALUES,
+        help="Ids per OR-filter request; 1 sends one request per id",
+    )
+    parser.add_argument(
+        "--cache-dir", type=Path, default=DEFAULT_CACHE_DIR,
+        help="Directory of the HTTP response cache",
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true", help="Always query the API"
+    )
+    args = parser.parse_args()
+
+    pmids, dois = read_ids(args.input)
+    asyncio.run(
+        harvest(
+            pmids,
+            dois,
+            args.output_dir,
+            args.checkpoint,
+            args.failed,
+            args.batch_size,
+            mailto=args.mailto,
+            base_url=args.base_url,
+            concurrency=args.concurrency,
+            rate=args.rate,
+            cache=None if args.no_cache else ResponseCache(args.cache_dir),
+        )
+    )
+    print(f"Process completed. Check {args.failed} for pending calls.")
+
+
+if __name__ == "__main__":
+    main()
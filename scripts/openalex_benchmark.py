@@ -0,0 +1,144 @@
+import argparse
+import asyncio
+import random
+import threading
+import time
+
+import requests
+from aiohttp import web
+
+from dsst_etl.openalex import OpenAlexHarvester
+
+"""
+Benchmarks OpenAlex harvesting against a local mock of the works API
+Compares the sequential loop of openalex_api.py (one requests.get per PMID,
+new connection each time, 50 ms sleep) with the asyncio harvester, with
+one request per PMID and with batched OR-filter requests
+The mock adds a fixed latency per request and answers a fraction of
+requests with 429 to exercise the retry path
+"""
+
+
+def make_work(pmid: str) -> dict:
+    return {
+        "id": f"https://openalex.org/W{pmid}",
+        "ids": {"pmid": f"https://pubmed.ncbi.nlm.nih.gov/{pmid}"},
+    }
+
+
+def make_app(latency: float, error_rate: float) -> web.Application:
+    async def work_by_pmid(request: web.Request) -> web.Response:
+        request.app["stats"]["requests"] += 1
+        await asyncio.sleep(latency)
+        if random.random() < error_rate:
+            return web.Response(status=429, headers={"Retry-After": "0"})
+        return web.json_response(make_work(request.match_info["pmid"]))
+
+    async def works_filter(request: web.Request) -> web.Response:
+        request.app["stats"]["requests"] += 1
+        await asyncio.sleep(latency)
+        if random.random() < error_rate:
+            return web.Response(status=429, headers={"Retry-After": "0"})
+        pmids = request.query["filter"].removeprefix("pmid:").split("|")
+        # Leave one id out of every batch to exercise the single-lookup fallback
+        return web.json_response(
+            {"results": [make_work(pmid) for pmid in pmids[1:]]}
+        )
+
+    app = web.Application()
+    app["stats"] = {"requests": 0}
+    app.router.add_get("/works/pmid:{pmid}", work_by_pmid)
+    app.router.add_get("/works", works_filter)
+    return app
+
+
+def start_mock_server(app: web.Application, port: int) -> None:
+    """Serve the mock API from a background thread."""
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(app)
+    loop.run_until_complete(runner.setup())
+    loop.run_until_complete(web.TCPSite(runner, "127.0.0.1", port).start())
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+
+
+def sequential(base_url: str, pmids: list[str]) -> int:
+    """The current openalex_api.py request loop."""
+    fetched = 0
+    for pmid in pmids:
+        time.sleep(0.05)
+        for _ in range(3):
+            response = requests.get(f"{base_url}/works/pmid:{pmid}")
+            if response.status_code == 200:
+                response.json()
+                fetched += 1
+                break
+            time.sleep(1)
+    return fetched
+
+
+def concurrent(
+    base_url: str,
+    pmids: list[str],
+    concurrency: int,
+    rate: float,
+    batch_size: int = 1,
+) -> int:
+    fetched = 0
+
+    def on_result(pmid: str, work: dict | None) -> None:
+        nonlocal fetched
+        fetched += work is not None
+
+    harvester = OpenAlexHarvester(
+        base_url=base_url, concurrency=concurrency, rate=rate
+    )
+    asyncio.run(harvester.harvest_pmids(pmids, on_result, batch_size))
+    return fetched
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark OpenAlex harvesting against a local mock API"
+    )
+    parser.add_argument("-n", "--num-pmids", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--error-rate", type=float, default=0.02)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument(
+        "--rate", type=float, default=10.0,
+        help="Harvester rate limit; raise it to measure raw throughput",
+    )
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--port", type=int, default=8089)
+    args = parser.parse_args()
+
+    app = make_app(args.latency, args.error_rate)
+    start_mock_server(app, args.port)
+    base_url = f"http://127.0.0.1:{args.port}"
+    pmids = [str(30000000 + i) for i in range(args.num_pmids)]
+
+    for name, run in [
+        ("sequential", lambda: sequential(base_url, pmids)),
+        (
+            "asyncio",
+            lambda: concurrent(base_url, pmids, args.concurrency, args.rate),
+        ),
+        (
+            "batched",
+            lambda: concurrent(
+                base_url, pmids, args.concurrency, args.rate, args.batch_size
+            ),
+        ),
+    ]:
+        app["stats"]["requests"] = 0
+        start = time.perf_counter()
+        fetched = run()
+        elapsed = time.perf_counter() - start
+        print(
+            f"{name:>10}: {fetched}/{len(pmids)} works in {elapsed:.1f}s "
+            f"({len(pmids) / elapsed:.1f} works/s, {app['stats']['requests']} requests)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+import argparse
+import csv
+import gc
+import gzip
+import io
+import json
+import random
+import time
+
+import orjson
+
+from openalex_flatten_works import csv_files, flatten_work, loads
+
+"""
+Microbenchmark of the stages of openalex_flatten_works.py on a fixed sample
+Decodes, flattens and compresses the same works with the old
+(json + DictWriter + gzip level 9) and the current choices
+The sample is generated from a fixed seed, or read from a works .gz file
+"""
+
+
+def synthetic_work(rng: random.Random, i: int) -> dict:
+    """A work with the fields and typical fan-out of a real snapshot record."""
+    work_id = f"https://openalex.org/W{i}"
+    words = [f"word{rng.randrange(2000)}" for _ in range(150)]
+    abstract = {}
+    for position, word in enumerate(words):
+        abstract.setdefault(word, []).append(position)
+    location = {
+        "source": {"id": f"https://openalex.org/S{rng.randrange(500)}"},
+        "landing_page_url": f"https://doi.org/10.1000/{i}",
+        "pdf_url": None,
+        "is_oa": rng.random() < 0.5,
+        "version": "publishedVersion",
+        "license": rng.choice([None, "cc-by", "cc-by-nc"]),
+    }
+    return {
+        "id": work_id,
+        "doi": f"https://doi.org/10.1000/{i}",
+        "title": " ".join(words[:12]),
+        "display_name": " ".join(words[:12]),
+        "publication_year": 2024,
+        "publication_date": "2024-01-01",
+        "type": "article",
+        "cited_by_count": rng.randrange(100),
+        "is_retracted": False,
+        "is_paratext": False,
+        "cited_by_api_url": f"https://api.openalex.org/works?filter=cites:W{i}",
+        "abstract_inverted_index": abstract,
+        "primary_location": location,
+        "locations": [location, dict(location, version="acceptedVersion")],
+        "best_oa_location": location,
+        "authorships": [
+            {
+                "author_position": "middle",
+                "author": {
+                    "id": f"https://openalex.org/A{rng.randrange(10**6)}"
+                },
+                "institutions": [
+                    {"id": f"https://openalex.org/I{rng.randrange(10**4)}"}
+                ],
+                "raw_affiliation_string": "National Institutes of Health",
+            }
+            for _ in range(6)
+        ],
+        "biblio": {
+            "volume": "1",
+            "issue": "2",
+            "first_page": "3",
+            "last_page": "4",
+        },
+        "concepts": [
+            {
+                "id": f"https://openalex.org/C{rng.randrange(1000)}",
+                "score": 0.5,
+            }
+            for _ in range(10)
+        ],
+        "ids": {
+            "openalex": work_id,
+            "doi": f"https://doi.org/10.1000/{i}",
+            "pmid": f"https://pubmed.ncbi.nlm.nih.gov/{30000000 + i}",
+        },
+        "mesh": [
+            {
+                "descriptor_ui": f"D{rng.randrange(10**5):06d}",
+                "descriptor_name": "Humans",
+                "qualifier_ui": "",
+                "qualifier_name": None,
+                "is_major_topic": False,
+            }
+            for _ in range(8)
+        ],
+        "open_access": {
+            "is_oa": True,
+            "oa_status": "gold",
+            "oa_url": f"https://doi.org/10.1000/{i}",
+            "any_repository_has_fulltext": True,
+        },
+        "referenced_works": [
+            f"https://openalex.org/W{rng.randrange(10**8)}" for _ in range(40)
+        ],
+        "related_works": [
+            f"https://openalex.org/W{rng.randrange(10**8)}" for _ in range(10)
+        ],
+    }
+
+
+def load_sample(sample: str | None, num_works: int) -> list[bytes]:
+    if sample:
+        with gzip.open(sample, "r") as f:
+            return [
+                line for line, _ in zip(f, range(num_works)) if line.strip()
+            ]
+    rng = random.Random(0)
+    return [
+        json.dumps(synthetic_work(rng, i)).encode("utf-8") + b"\n"
+        for i in range(num_works)
+    ]
+
+
+def timed(name: str, func, size: float, unit: str):
+    # like timeit, keep the garbage collector from skewing the stages
+    gc.collect()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+    finally:
+        gc.enable()
+    print(f"{name:>32}: {elapsed:7.3f}s ({size / elapsed:12,.0f} {unit}/s)")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the OpenAlex flattener stages"
+    )
+    parser.add_argument("-n", "--num-works", type=int, default=5000)
+    parser.add_argument(
+        "--sample", help="works .gz file to use instead of synthetic works"
+    )
+    args = parser.parse_args()
+
+    lines = load_sample(args.sample, args.num_works)
+    n = len(lines)
+    print(f"{n} works, {sum(map(len, lines)) / 2**20:.1f} MiB of JSON")
+
+    works = timed(
+        "json.loads", lambda: [json.loads(ln) for ln in lines], n, "works"
+    )
+    timed(
+        "orjson.loads", lambda: [orjson.loads(ln) for ln in lines], n, "works"
+    )
+
+    abstracts = [w["abstract_inverted_index"] for w in works]
+    timed(
+        "json.dumps abstract",
+        lambda: [json.dumps(a, ensure_ascii=False) for a in abstracts],
+        n,
+        "works",
+    )
+    timed(
+        "orjson.dumps abstract",
+        lambda: [orjson.dumps(a).decode("utf-8") for a in abstracts],
+        n,
+        "works",
+    )
+
+    columns = csv_files["works"]["authorships"]["columns"]
+    rows = [
+        {
+            "work_id": w["id"],
+            "author_position": a["author_position"],
+            "author_id": a["author"]["id"],
+            "institution_id": a["institutions"][0]["id"],
+            "raw_affiliation_string": a["raw_affiliation_string"],
+        }
+        for w in works
+        for a in w["authorships"]
+        if a.get("institutions")
+    ]
+    tuples = [tuple(row[column] for column in columns) for row in rows]
+    timed(
+        "DictWriter authorships",
+        lambda: csv.DictWriter(io.StringIO(), columns).writerows(rows),
+        len(rows),
+        "rows",
+    )
+    timed(
+        "csv.writer authorships",
+        lambda: csv.writer(io.StringIO()).writerows(tuples),
+        len(rows),
+        "rows",
+    )
+
+    def flatten():
+        buffers = {table: io.StringIO() for table in csv_files["works"]}
+        writers = {
+            table: csv.writer(buffer) for table, buffer in buffers.items()
+        }
+        for line in lines:
+            flatten_work(loads(line), writers)
+        return "".join(buffer.getvalue() for buffer in buffers.values())
+
+    csv_text = timed("decode + flatten_work", flatten, n, "works").encode(
+        "utf-8"
+    )
+    size = len(csv_text)
+    print(f"{size / 2**20:.1f} MiB of csv")
+    for level in (9, 6, 1):
+        compressed = timed(
+            f"gzip compresslevel={level}",
+            lambda: gzip.compress(csv_text, compresslevel=level),
+            size / 2**20,
+            "MiB",
+        )
+        print(f"{'':>34}{len(compressed) / size:.1%} of csv size")
+
+
+if __name__ == "__main__":
+    main()
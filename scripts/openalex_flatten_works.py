@@ -1,23 +1,47 @@
+import argparse
 import csv
 import glob
 import gzip
-import json
+import io
 import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import ExitStack
 from pathlib import Path
 
+import orjson
+import pyarrow as pa
+import pyarrow.parquet as pq
+
 """
 Processes the gziped json lines file
 Produces a csv file for each openalex_works_* table
 Check openalex repositories for changes in json objects
 https://github.com/ourresearch/openalex-documentation-scripts/
+With --workers, each snapshot file is flattened in its own process into
+per-table partition directories (csv-files/works_*/<file>.csv.gz), which are
+merged into the single csv files unless --no-merge is given
+JSON is decoded with orjson, and --compresslevel trades
+csv.gz size for speed
+With --format parquet, each table is written as a typed Parquet dataset
+(parquet-files/works_*/<file>.parquet) for analysis outside Postgres
 """
 DATA_PATH = Path("./delme_data")
 SNAPSHOT_DIR = DATA_PATH / "openalex-snapshot"
 CSV_DIR = DATA_PATH / "csv-files"
-# create output folder if it doesn't exist
-os.makedirs(CSV_DIR, exist_ok=True)
+PARQUET_DIR = DATA_PATH / "parquet-files"
 
 FILES_PER_ENTITY = int(os.environ.get("OPENALEX_DEMO_FILES_PER_ENTITY", "0"))
+# gzip level of the csv files; 1 is several times faster than the default 9
+# and the files are only read back by the loader
+COMPRESSLEVEL = 1
+
+loads = orjson.loads
+
+
+def dumps(obj):
+    return orjson.dumps(obj).decode("utf-8")
+
 
 csv_files = {
     "works": {
@@ -134,249 +158,420 @@ csv_files = {
     }
 }
 
+WORKS_COLUMNS = csv_files["works"]["works"]["columns"]
+# columns read from the nested object, after work_id
+BIBLIO_COLUMNS = csv_files["works"]["biblio"]["columns"][1:]
+IDS_COLUMNS = csv_files["works"]["ids"]["columns"][1:]
+MESH_COLUMNS = csv_files["works"]["mesh"]["columns"][1:]
+OPEN_ACCESS_COLUMNS = csv_files["works"]["open_access"]["columns"][1:]
+
+# Parquet types of the columns that are not text, as in openalex_create_db.sql
+PARQUET_TYPES = {
+    "publication_year": pa.int32(),
+    "cited_by_count": pa.int32(),
+    "is_retracted": pa.bool_(),
+    "is_paratext": pa.bool_(),
+    "is_oa": pa.bool_(),
+    "score": pa.float32(),
+    "mag": pa.int64(),
+    "is_major_topic": pa.bool_(),
+    "any_repository_has_fulltext": pa.bool_(),
+}
+# low-cardinality columns repeated across rows
+DICTIONARY_COLUMNS = {
+    "source_id",
+    "concept_id",
+    "license",
+    "version",
+    "oa_status",
+    "type",
+    "author_position",
+}
+ROW_GROUP_SIZE = 100_000
+
+
+def table_name(table):
+    """Database table of a csv_files["works"] entry."""
+    return "openalex_works" if table == "works" else f"openalex_works_{table}"
+
+
+def location_row(work_id, location):
+    return (
+        work_id,
+        location["source"]["id"],
+        location.get("landing_page_url"),
+        location.get("pdf_url"),
+        location.get("is_oa"),
+        location.get("version"),
+        location.get("license"),
+    )
+
+
+def flatten_work(work, writers):
+    """
+    Write the rows of one work to the csv writer of each table. Rows are
+    positional, in the order of the table's columns.
+    """
+    if not (work_id := work.get("id")):
+        return
+
+    # works
+    row = [work.get(column) for column in WORKS_COLUMNS]
+    if (abstract := work.get("abstract_inverted_index")) is not None:
+        row[-1] = dumps(abstract)
+    writers["works"].writerow(row)
+
+    # primary_locations
+    if primary_location := (work.get("primary_location") or {}):
+        if (primary_location.get("source") or {}).get("id"):
+            writers["primary_locations"].writerow(
+                location_row(work_id, primary_location)
+            )
+
+    # locations
+    for location in work.get("locations") or []:
+        if (location.get("source") or {}).get("id"):
+            writers["locations"].writerow(location_row(work_id, location))
+
+    # best_oa_locations
+    if best_oa_location := (work.get("best_oa_location") or {}):
+        if (best_oa_location.get("source") or {}).get("id"):
+            writers["best_oa_locations"].writerow(
+                location_row(work_id, best_oa_location)
+            )
+
+    # authorships
+    for authorship in work.get("authorships") or []:
+        if author_id := authorship.get("author", {}).get("id"):
+            institution_ids = [
+                i.get("id") for i in authorship.get("institutions")
+            ]
+            institution_ids = [i for i in institution_ids if i] or [None]
 
-def flatten_works():
-    file_spec = csv_files["works"]
-
-    with gzip.open(
-        file_spec["works"]["name"], "wt", encoding="utf-8"
-    ) as works_csv, gzip.open(
-        file_spec["primary_locations"]["name"], "wt", encoding="utf-8"
-    ) as primary_locations_csv, gzip.open(
-        file_spec["locations"]["name"], "wt", encoding="utf-8"
-    ) as locations, gzip.open(
-        file_spec["best_oa_locations"]["name"], "wt", encoding="utf-8"
-    ) as best_oa_locations, gzip.open(
-        file_spec["authorships"]["name"], "wt", encoding="utf-8"
-    ) as authorships_csv, gzip.open(
-        file_spec["biblio"]["name"], "wt", encoding="utf-8"
-    ) as biblio_csv, gzip.open(
-        file_spec["concepts"]["name"], "wt", encoding="utf-8"
-    ) as concepts_csv, gzip.open(
-        file_spec["ids"]["name"], "wt", encoding="utf-8"
-    ) as ids_csv, gzip.open(
-        file_spec["mesh"]["name"], "wt", encoding="utf-8"
-    ) as mesh_csv, gzip.open(
-        file_spec["open_access"]["name"], "wt", encoding="utf-8"
-    ) as open_access_csv, gzip.open(
-        file_spec["referenced_works"]["name"], "wt", encoding="utf-8"
-    ) as referenced_works_csv, gzip.open(
-        file_spec["related_works"]["name"], "wt", encoding="utf-8"
-    ) as related_works_csv:
-
-        works_writer = init_dict_writer(
-            works_csv, file_spec["works"], extrasaction="ignore"
+            for institution_id in institution_ids:
+                writers["authorships"].writerow(
+                    (
+                        work_id,
+                        authorship.get("author_position"),
+                        author_id,
+                        institution_id,
+                        authorship.get("raw_affiliation_string"),
+                    )
+                )
+
+    # biblio
+    if biblio := work.get("biblio"):
+        writers["biblio"].writerow((work_id, *map(biblio.get, BIBLIO_COLUMNS)))
+
+    # concepts
+    for concept in work.get("concepts"):
+        if concept_id := concept.get("id"):
+            writers["concepts"].writerow(
+                (work_id, concept_id, concept.get("score"))
+            )
+
+    # ids
+    if ids := work.get("ids"):
+        writers["ids"].writerow((work_id, *map(ids.get, IDS_COLUMNS)))
+
+    # mesh
+    for mesh in work.get("mesh"):
+        writers["mesh"].writerow((work_id, *map(mesh.get, MESH_COLUMNS)))
+
+    # open_access
+    if open_access := work.get("open_access"):
+        writers["open_access"].writerow(
+            (work_id, *map(open_access.get, OPEN_ACCESS_COLUMNS))
         )
-        primary_locations_writer = init_dict_writer(
-            primary_locations_csv, file_spec["primary_locations"]
+
+    # referenced_works
+    for referenced_work in work.get("referenced_works"):
+        if referenced_work:
+            writers["referenced_works"].writerow((work_id, referenced_work))
+
+    # related_works
+    for related_work in work.get("related_works"):
+        if related_work:
+            writers["related_works"].writerow((work_id, related_work))
+
+
+def flatten_jsonl(jsonl_file_name, writers):
+    """Flatten every work of a gzipped JSON lines snapshot file."""
+    works = 0
+    with gzip.open(jsonl_file_name, "r") as works_jsonl:
+        for work_json in works_jsonl:
+            if not work_json.strip():
+                continue
+            flatten_work(loads(work_json), writers)
+            works += 1
+    return works
+
+
+def snapshot_files():
+    jsonl_file_names = sorted(
+        # recursive, for works/updated_date=*/part_*.gz snapshot partitions
+        glob.glob(
+            os.path.join(SNAPSHOT_DIR, "works", "**", "*.gz"), recursive=True
         )
-        locations_writer = init_dict_writer(locations, file_spec["locations"])
-        best_oa_locations_writer = init_dict_writer(
-            best_oa_locations, file_spec["best_oa_locations"]
+    )
+    if FILES_PER_ENTITY:
+        jsonl_file_names = jsonl_file_names[:FILES_PER_ENTITY]
+    return jsonl_file_names
+
+
+def flatten_works(compresslevel=COMPRESSLEVEL):
+    """Flatten the snapshot sequentially into one csv file per table."""
+    with ExitStack() as stack:
+        writers = init_writers(
+            stack,
+            {
+                table: spec["name"]
+                for table, spec in csv_files["works"].items()
+            },
+            compresslevel,
         )
-        authorships_writer = init_dict_writer(
-            authorships_csv, file_spec["authorships"]
+        for jsonl_file_name in snapshot_files():
+            print(jsonl_file_name)
+            flatten_jsonl(jsonl_file_name, writers)
+
+
+def partition_dir(table):
+    """Directory holding the per-input-file parts of a table."""
+    return Path(csv_files["works"][table]["name"].removesuffix(".csv.gz"))
+
+
+def part_name(jsonl_file_name):
+    """
+    Name of the parts produced from a snapshot file, unique across
+    updated_date=* partitions, e.g. updated_date=2024-01-01_part_000
+    """
+    relative = Path(jsonl_file_name).relative_to(SNAPSHOT_DIR / "works")
+    return "_".join(relative.with_suffix("").parts)
+
+
+def flatten_file(jsonl_file_name, compresslevel=COMPRESSLEVEL):
+    """
+    Flatten one snapshot file into header-less parts, one per table, named
+    after the input file so parts from different workers never collide.
+    """
+    name = part_name(jsonl_file_name)
+    with ExitStack() as stack:
+        writers = init_writers(
+            stack,
+            {
+                table: partition_dir(table) / f"{name}.csv.gz"
+                for table in csv_files["works"]
+            },
+            compresslevel,
+            header=False,
         )
-        biblio_writer = init_dict_writer(biblio_csv, file_spec["biblio"])
-        concepts_writer = init_dict_writer(concepts_csv, file_spec["concepts"])
-        ids_writer = init_dict_writer(
-            ids_csv, file_spec["ids"], extrasaction="ignore"
+        return flatten_jsonl(jsonl_file_name, writers)
+
+
+def merge_partitions():
+    """
+    Merge the parts of each table into the single csv file of the
+    sequential mode. Gzip members can be concatenated, so the header is
+    written as its own member and the parts are appended without
+    recompressing them.
+    """
+    for table, spec in csv_files["works"].items():
+        header = io.StringIO()
+        csv.writer(header).writerow(spec["columns"])
+        with open(spec["name"], "wb") as merged:
+            merged.write(gzip.compress(header.getvalue().encode("utf-8")))
+            for part in sorted(partition_dir(table).glob("*.csv.gz")):
+                with open(part, "rb") as f:
+                    shutil.copyfileobj(f, merged)
+        shutil.rmtree(partition_dir(table))
+
+
+def flatten_works_parallel(workers, merge=True, compresslevel=COMPRESSLEVEL):
+    """
+    Flatten each snapshot file in its own process. Without ``merge`` the
+    per-table partition directories are left for openalex_psql_insert.py.
+    """
+    for table in csv_files["works"]:
+        os.makedirs(partition_dir(table), exist_ok=True)
+
+    map_snapshot_files(workers, flatten_file, compresslevel)
+    if merge:
+        merge_partitions()
+
+
+def map_snapshot_files(workers, func, *args):
+    """Run ``func(jsonl_file_name, *args)`` for every snapshot file."""
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(func, jsonl_file_name, *args): jsonl_file_name
+            for jsonl_file_name in snapshot_files()
+        }
+        for future in as_completed(futures):
+            print(f"{futures[future]}: {future.result()} works")
+
+
+def init_writers(stack, paths, compresslevel, header=True):
+    """Open a gzipped csv writer for each table in ``paths``."""
+    writers = {}
+    for table, path in paths.items():
+        csv_file = stack.enter_context(
+            gzip.open(
+                path, "wt", encoding="utf-8", compresslevel=compresslevel
+            )
         )
-        mesh_writer = init_dict_writer(mesh_csv, file_spec["mesh"])
-        open_access_writer = init_dict_writer(
-            open_access_csv, file_spec["open_access"]
+        writers[table] = csv.writer(csv_file)
+        if header:
+            writers[table].writerow(csv_files["works"][table]["columns"])
+    return writers
+
+
+def parquet_schema(table):
+    return pa.schema(
+        [
+            (column, PARQUET_TYPES.get(column, pa.string()))
+            for column in csv_files["works"][table]["columns"]
+        ]
+    )
+
+
+def to_arrow(values, field):
+    """
+    Build a column, converting the values the snapshot does not always
+    type consistently (e.g. ids.mag as a string).
+    """
+    try:
+        return pa.array(values, type=field.type)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        if pa.types.is_string(field.type):
+            convert = str
+        elif pa.types.is_integer(field.type):
+            convert = int
+        elif pa.types.is_floating(field.type):
+            convert = float
+        else:
+            raise
+        return pa.array(
+            [None if v is None or v == "" else convert(v) for v in values],
+            type=field.type,
         )
-        referenced_works_writer = init_dict_writer(
-            referenced_works_csv, file_spec["referenced_works"]
+
+
+class ParquetTableWriter:
+    """Writer for flatten_work that buffers rows into Parquet row groups."""
+
+    def __init__(self, path, schema, row_group_size=ROW_GROUP_SIZE):
+        self.schema = schema
+        self.row_group_size = row_group_size
+        self._writer = pq.ParquetWriter(
+            path,
+            schema,
+            compression="zstd",
+            use_dictionary=[
+                name for name in schema.names if name in DICTIONARY_COLUMNS
+            ],
         )
-        related_works_writer = init_dict_writer(
-            related_works_csv, file_spec["related_works"]
+        self._columns = [[] for _ in schema.names]
+
+    def writerow(self, row):
+        for column, value in zip(self._columns, row):
+            column.append(value)
+        if len(self._columns[0]) >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        if not self._columns[0]:
+            return
+        arrays = [
+            to_arrow(values, field)
+            for values, field in zip(self._columns, self.schema)
+        ]
+        self._writer.write_table(
+            pa.Table.from_arrays(arrays, schema=self.schema),
+            row_group_size=self.row_group_size,
         )
+        self._columns = [[] for _ in self.schema.names]
 
-        files_done = 0
-        for jsonl_file_name in glob.glob(
-            os.path.join(SNAPSHOT_DIR, "works", "*.gz")
-        ):
-            print(jsonl_file_name)
-            with gzip.open(jsonl_file_name, "r") as works_jsonl:
-                for work_json in works_jsonl:
-                    if not work_json.strip():
-                        continue
-
-                    work = json.loads(work_json)
-
-                    if not (work_id := work.get("id")):
-                        continue
-
-                    # works
-                    if (
-                        abstract := work.get("abstract_inverted_index")
-                    ) is not None:
-                        work["abstract_inverted_index"] = json.dumps(
-                            abstract, ensure_ascii=False
-                        )
-
-                    works_writer.writerow(work)
-
-                    # primary_locations
-                    if primary_location := (
-                        work.get("primary_location") or {}
-                    ):
-                        if primary_location.get(
-                            "source"
-                        ) and primary_location.get("source").get("id"):
-                            primary_locations_writer.writerow(
-                                {
-                                    "work_id": work_id,
-                                    "source_id": primary_location["source"][
-                                        "id"
-                                    ],
-                                    "landing_page_url": primary_location.get(
-                                        "landing_page_url"
-                                    ),
-                                    "pdf_url": primary_location.get("pdf_url"),
-                                    "is_oa": primary_location.get("is_oa"),
-                                    "version": primary_location.get("version"),
-                                    "license": primary_location.get("license"),
-                                }
-                            )
-
-                    # locations
-                    if locations := work.get("locations"):
-                        for location in locations:
-                            if location.get("source") and location.get(
-                                "source"
-                            ).get("id"):
-                                locations_writer.writerow(
-                                    {
-                                        "work_id": work_id,
-                                        "source_id": location["source"]["id"],
-                                        "landing_page_url": location.get(
-                                            "landing_page_url"
-                                        ),
-                                        "pdf_url": location.get("pdf_url"),
-                                        "is_oa": location.get("is_oa"),
-                                        "version": location.get("version"),
-                                        "license": location.get("license"),
-                                    }
-                                )
-
-                    # best_oa_locations
-                    if best_oa_location := (
-                        work.get("best_oa_location") or {}
-                    ):
-                        if best_oa_location.get(
-                            "source"
-                        ) and best_oa_location.get("source").get("id"):
-                            best_oa_locations_writer.writerow(
-                                {
-                                    "work_id": work_id,
-                                    "source_id": best_oa_location["source"][
-                                        "id"
-                                    ],
-                                    "landing_page_url": best_oa_location.get(
-                                        "landing_page_url"
-                                    ),
-                                    "pdf_url": best_oa_location.get("pdf_url"),
-                                    "is_oa": best_oa_location.get("is_oa"),
-                                    "version": best_oa_location.get("version"),
-                                    "license": best_oa_location.get("license"),
-                                }
-                            )
-
-                    # authorships
-                    if authorships := work.get("authorships"):
-                        for authorship in authorships:
-                            if author_id := authorship.get("author", {}).get(
-                                "id"
-                            ):
-                                institutions = authorship.get("institutions")
-                                institution_ids = [
-                                    i.get("id") for i in institutions
-                                ]
-                                institution_ids = [
-                                    i for i in institution_ids if i
-                                ]
-                                institution_ids = institution_ids or [None]
-
-                                for institution_id in institution_ids:
-                                    authorships_writer.writerow(
-                                        {
-                                            "work_id": work_id,
-                                            "author_position": authorship.get(
-                                                "author_position"
-                                            ),
-                                            "author_id": author_id,
-                                            "institution_id": institution_id,
-                                            "raw_affiliation_string": authorship.get(
-                                                "raw_affiliation_string"
-                                            ),
-                                        }
-                                    )
-
-                    # biblio
-                    if biblio := work.get("biblio"):
-                        biblio["work_id"] = work_id
-                        biblio_writer.writerow(biblio)
-
-                    # concepts
-                    for concept in work.get("concepts"):
-                        if concept_id := concept.get("id"):
-                            concepts_writer.writerow(
-                                {
-                                    "work_id": work_id,
-                                    "concept_id": concept_id,
-                                    "score": concept.get("score"),
-                                }
-                            )
-
-                    # ids
-                    if ids := work.get("ids"):
-                        ids["work_id"] = work_id
-                        ids_writer.writerow(ids)
-
-                    # mesh
-                    for mesh in work.get("mesh"):
-                        mesh["work_id"] = work_id
-                        mesh_writer.writerow(mesh)
-
-                    # open_access
-                    if open_access := work.get("open_access"):
-                        open_access["work_id"] = work_id
-                        open_access_writer.writerow(open_access)
-
-                    # referenced_works
-                    for referenced_work in work.get("referenced_works"):
-                        if referenced_work:
-                            referenced_works_writer.writerow(
-                                {
-                                    "work_id": work_id,
-                                    "referenced_work_id": referenced_work,
-                                }
-                            )
-
-                    # related_works
-                    for related_work in work.get("related_works"):
-                        if related_work:
-                            related_works_writer.writerow(
-                                {
-                                    "work_id": work_id,
-                                    "related_work_id": related_work,
-                                }
-                            )
-
-            files_done += 1
-            if FILES_PER_ENTITY and files_done >= FILES_PER_ENTITY:
-                break
-
-
-def init_dict_writer(csv_file, file_spec, **kwargs):
-    writer = csv.DictWriter(
-        csv_file, fieldnames=file_spec["columns"], **kwargs
+    def close(self):
+        self.flush()
+        self._writer.close()
+
+
+def parquet_dir(table):
+    """Directory holding the Parquet dataset of a table."""
+    return PARQUET_DIR / partition_dir(table).name
+
+
+def flatten_parquet_file(jsonl_file_name, row_group_size=ROW_GROUP_SIZE):
+    """Flatten one snapshot file into a Parquet file per table."""
+    name = part_name(jsonl_file_name)
+    with ExitStack() as stack:
+        writers = {}
+        for table in csv_files["works"]:
+            writers[table] = ParquetTableWriter(
+                parquet_dir(table) / f"{name}.parquet",
+                parquet_schema(table),
+                row_group_size,
+            )
+            stack.callback(writers[table].close)
+        return flatten_jsonl(jsonl_file_name, writers)
+
+
+def flatten_works_parquet(workers, row_group_size=ROW_GROUP_SIZE):
+    for table in csv_files["works"]:
+        os.makedirs(parquet_dir(table), exist_ok=True)
+    map_snapshot_files(workers, flatten_parquet_file, row_group_size)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Flatten the OpenAlex works snapshot into csv files"
+    )
+    parser.add_argument(
+        "--format",
+        choices=["csv", "parquet"],
+        default="csv",
+        help="Write csv.gz files for the loader or Parquet datasets",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Processes flattening snapshot files in parallel",
+    )
+    parser.add_argument(
+        "--no-merge",
+        action="store_true",
+        help="Keep the per-file partitions for the loader",
+    )
+    parser.add_argument(
+        "--compresslevel",
+        type=int,
+        default=COMPRESSLEVEL,
+        choices=range(1, 10),
+        metavar="{1..9}",
+        help="gzip level of the csv files",
     )
-    writer.writeheader()
-    return writer
+    parser.add_argument(
+        "--row-group-size",
+        type=int,
+        default=ROW_GROUP_SIZE,
+        help="Rows per Parquet row group",
+    )
+    args = parser.parse_args()
+
+    if args.format == "parquet":
+        flatten_works_parquet(args.workers, args.row_group_size)
+        return
+
+    # create output folder if it doesn't exist
+    os.makedirs(CSV_DIR, exist_ok=True)
+    if args.workers > 1 or args.no_merge:
+        flatten_works_parallel(
+            args.workers, not args.no_merge, args.compresslevel
+        )
+    else:
+        flatten_works(args.compresslevel)
 
 
 if __name__ == "__main__":
-    flatten_works()
+    main()
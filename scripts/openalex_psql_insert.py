@@ -1,16 +1,210 @@
+import argparse
 import gzip
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import psycopg2
 from dotenv import load_dotenv
+from psycopg2.pool import ThreadedConnectionPool
 
 """
 Loads all csv files into database
+Tables flattened with --no-merge are read from their partition directory
+(e.g. works_ids/), whose parts have no header
+Keys and indexes are built once the data is loaded, followed by ANALYZE
+With --workers N, tables and their partitions are copied concurrently into
+UNLOGGED staging tables, whose rows are then added to the tables in one
+transaction
+Rows are appended to the existing tables; --replace replaces the tables
+instead and clears the --incremental sync state of openalex_psql_stream.py,
+so the next sync loads every partition again
 """
 
+INDEXES_SQL_FILE = Path("sql-create/openalex_create_indexes.sql")
+SYNC_STATE_TABLES = ["openalex_sync_state", "openalex_sync_manifests"]
+
+
+def build_indexes(conn):
+    """Create the openalex_works* keys and indexes, then ANALYZE."""
+    with open(INDEXES_SQL_FILE) as f:
+        sql = f.read()
+    # the file manages its own transaction; ANALYZE runs outside of it
+    conn.autocommit = True
+    start = time.perf_counter()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(sql)
+    finally:
+        conn.autocommit = False
+    print(f"Built indexes in {time.perf_counter() - start:.0f}s")
+
+
+def clear_sync_state(cursor):
+    """Empty the incremental sync tables, if a sync has created them."""
+    for table_name in SYNC_STATE_TABLES:
+        cursor.execute("SELECT to_regclass(%s)", (table_name,))
+        if cursor.fetchone()[0] is not None:
+            cursor.execute(f"TRUNCATE {table_name}")
+
+
+def table_parts(data_path, csv_name):
+    """
+    Files to COPY into a table, and whether they have a header: the parts
+    of its partition directory if the flattener left one, else its csv.
+    """
+    partition_dir = data_path.joinpath(csv_name.removesuffix(".csv.gz"))
+    if partition_dir.is_dir():
+        return sorted(partition_dir.glob("*.csv.gz")), "FALSE"
+    return [data_path.joinpath(csv_name)], "TRUE"
+
+
+def parallel_load(
+    db_params, data_path, table_mapping, table_columns, workers, replace
+):
+    """
+    COPY every table and partition concurrently over a connection pool.
+
+    Rows go into UNLOGGED staging tables with synchronous_commit off, so
+    the copies write no WAL. The staged rows are then appended to the
+    tables in one transaction, so readers see either none or all of them.
+    With ``replace``, the staging tables are instead made LOGGED and
+    swapped in for the tables, and the sync state is cleared in the same
+    transaction.
+    """
+    pool = ThreadedConnectionPool(1, workers, **db_params)
+    stats = {
+        table: {"rows": 0, "start": None, "end": None}
+        for table in table_columns
+    }
+    lock = threading.Lock()
+
+    def run(sql_statements, clear_state=False):
+        conn = pool.getconn()
+        try:
+            with conn.cursor() as cursor:
+                if clear_state:
+                    clear_sync_state(cursor)
+                for sql in sql_statements:
+                    cursor.execute(sql)
+            conn.commit()
+        finally:
+            pool.putconn(conn)
+
+    def copy_part(table_name, part, header):
+        columns = ", ".join(table_columns[table_name])
+        copy_sql = (
+            f"COPY {table_name}_load ({columns}) FROM STDIN WITH"
+            + f" (FORMAT CSV, HEADER {header})"
+        )
+        conn = pool.getconn()
+        try:
+            start = time.perf_counter()
+            with conn.cursor() as cursor, gzip.open(part, "rt") as f:
+                cursor.execute("SET synchronous_commit = off")
+                cursor.copy_expert(copy_sql, f)
+                rows = cursor.rowcount
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            pool.putconn(conn)
+        with lock:
+            table_stats = stats[table_name]
+            table_stats["rows"] += rows
+            table_stats["start"] = min(table_stats["start"] or start, start)
+            table_stats["end"] = time.perf_counter()
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for future in [
+                executor.submit(
+                    run,
+                    [
+                        f"DROP TABLE IF EXISTS {table_name}_load",
+                        f"CREATE UNLOGGED TABLE {table_name}_load"
+                        f" (LIKE {table_name} INCLUDING DEFAULTS)",
+                    ],
+                )
+                for table_name in table_columns
+            ]:
+                future.result()
+
+            futures = []
+            for table_name in table_columns:
+                parts, header = table_parts(
+                    data_path, table_mapping[table_name]
+                )
+                futures += [
+                    executor.submit(copy_part, table_name, part, header)
+                    for part in parts
+                ]
+            for future in futures:
+                future.result()
+
+            for table_name, table_stats in stats.items():
+                elapsed = (table_stats["end"] or 0) - (
+                    table_stats["start"] or 0
+                )
+                print(
+                    f"{table_name}: {table_stats['rows']} rows"
+                    f" ({table_stats['rows'] / max(elapsed, 1e-9):,.0f} rows/s)"
+                )
+
+            if replace:
+                # SET LOGGED rewrites each table, so do it concurrently
+                for future in [
+                    executor.submit(
+                        run, [f"ALTER TABLE {table_name}_load SET LOGGED"]
+                    )
+                    for table_name in table_columns
+                ]:
+                    future.result()
+
+        if replace:
+            swap = []
+            for table_name in table_columns:
+                swap += [
+                    f"DROP TABLE {table_name}",
+                    f"ALTER TABLE {table_name}_load RENAME TO {table_name}",
+                ]
+            run(swap, clear_state=True)
+            return
+
+        append = []
+        for table_name, columns in table_columns.items():
+            columns = ", ".join(columns)
+            append += [
+                f"INSERT INTO {table_name} ({columns})"
+                f" SELECT {columns} FROM {table_name}_load",
+                f"DROP TABLE {table_name}_load",
+            ]
+        run(append)
+    finally:
+        pool.closeall()
+
 
 def main():
+    parser = argparse.ArgumentParser(
+        description="Load the flattened OpenAlex csv files into Postgres"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Concurrent COPY connections",
+    )
+    parser.add_argument(
+        "--replace",
+        action="store_true",
+        help="Replace the tables instead of appending, and clear the"
+        " --incremental sync state",
+    )
+    args = parser.parse_args()
+
     load_dotenv()
     data_path = Path(r"./delme_data/csv-files/")
     # Database parameters from .env
@@ -123,26 +317,46 @@ def main():
         "openalex_works_related_works": ["work_id", "related_work_id"],
     }
 
+    if args.workers > 1:
+        parallel_load(
+            db_params,
+            data_path,
+            table_mapping,
+            table_columns,
+            args.workers,
+            args.replace,
+        )
+        conn = psycopg2.connect(**db_params)
+        try:
+            build_indexes(conn)
+        finally:
+            conn.close()
+        return
+
     # Connect to the database
     conn = psycopg2.connect(**db_params)
     cursor = None
     try:
         cursor = conn.cursor()
+        if args.replace:
+            cursor.execute(f"TRUNCATE {', '.join(table_columns)}")
+            clear_sync_state(cursor)
 
         # Execute COPY for each table
         for table_name, columns in table_columns.items():
-            with gzip.open(
-                data_path.joinpath(table_mapping[table_name]), "rt"
-            ) as f:
-                copy_sql = (
-                    f"COPY {table_name} FROM STDIN WITH"
-                    + " (FORMAT CSV, HEADER TRUE)"
-                )
-                cursor.copy_expert(copy_sql, f)
+            parts, header = table_parts(data_path, table_mapping[table_name])
+            copy_sql = (
+                f"COPY {table_name} ({', '.join(columns)}) FROM STDIN WITH"
+                + f" (FORMAT CSV, HEADER {header})"
+            )
+            for part in parts:
+                with gzip.open(part, "rt") as f:
+                    cursor.copy_expert(copy_sql, f)
 
         conn.commit()
+        build_indexes(conn)
     except psycopg2.Error as e:
-        print(f"Error: {e}")
+        raise SystemExit(f"Error: {e}")
     finally:
         if cursor:
             cursor.close()
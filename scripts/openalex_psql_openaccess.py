@@ -1,10 +1,12 @@
+import argparse
 import os
 from pathlib import Path
 
-import pandas as pd
 import psycopg2
 from dotenv import load_dotenv
 
+from dsst_etl.export import RowWriter, stream_query
+
 # .env variables
 load_dotenv()
 
@@ -20,89 +22,57 @@ DATA_PATH = Path("delme_data")
 OPEN_ACCESS_PATH = Path(DATA_PATH) / "oa_urls.csv"
 NOT_OA_PATH = Path(DATA_PATH) / "not_oa_pmids.csv"
 
-
-def get_oa_urls():
+OA_QUERY = """
+    SELECT o.is_oa, i.pmid, i.doi, o.oa_url
+    FROM openalex_works_open_access o
+    JOIN openalex_works_ids i ON i.work_id = o.work_id
+    WHERE o.is_oa IS NOT NULL
+"""
+PMID_PREFIX = "https://pubmed.ncbi.nlm.nih.gov/"
+
+
+def export_oa(output_format: str = "csv", batch_size: int = 10000):
+    """
+    Write the PMID and oa_url of open access works, and the PMID and DOI
+    of closed access works, from one JOIN streamed through a server-side
+    cursor.
+    """
+    conn = psycopg2.connect(**db_params)
+    suffix = ".parquet" if output_format == "parquet" else ".csv"
+    oa = RowWriter(OPEN_ACCESS_PATH.with_suffix(suffix), ["PMID", "oa_url"])
+    not_oa = RowWriter(NOT_OA_PATH.with_suffix(suffix), ["PMID", "DOI"])
     try:
-        conn = psycopg2.connect(**db_params)
-        cursor = conn.cursor()
-
-        # Get pmid|oa_url for open access works
-        cursor.execute(
-            """
-            SELECT o.work_id, o.oa_url
-            FROM openalex_works_open_access o
-            WHERE o.is_oa = TRUE
-        """
-        )
-        result = cursor.fetchall()
-
-        work_ids = [work_id for work_id, _ in result]
-        oa_urls = [oa_url for _, oa_url in result]
-
-        # Get pmids for these works
-        cursor.execute(
-            """
-            SELECT i.pmid
-            FROM openalex_works_ids i
-            WHERE i.work_id IN %s
-        """,
-            (tuple(work_ids),),
-        )
-        pmid_values = cursor.fetchall()
-
-        pmid_url_dict = {
-            pmid[0].replace("https://pubmed.ncbi.nlm.nih.gov/", ""): oa_url
-            for pmid, oa_url in zip(pmid_values, oa_urls)
-        }
-
-        pmid_url_df = pd.DataFrame(
-            pmid_url_dict.items(), columns=["PMID", "oa_url"]
-        )
-        pmid_url_df.to_csv(OPEN_ACCESS_PATH, index=False)
-
+        oa_pmids = set()
+        for rows in stream_query(conn, OA_QUERY, batch_size=batch_size):
+            oa_rows = []
+            not_oa_rows = []
+            for is_oa, pmid, doi, oa_url in rows:
+                if not is_oa:
+                    not_oa_rows.append((pmid, doi))
+                elif pmid:
+                    pmid = pmid.replace(PMID_PREFIX, "")
+                    if pmid not in oa_pmids:
+                        oa_pmids.add(pmid)
+                        oa_rows.append((pmid, oa_url))
+            oa.write(oa_rows)
+            not_oa.write(not_oa_rows)
+        print(f"{oa.rows} rows in {oa.path}, {not_oa.rows} in {not_oa.path}")
     except psycopg2.Error as e:
         print("Error:", e)
     finally:
-        cursor.close()
+        oa.close()
+        not_oa.close()
         conn.close()
 
 
-def get_not_oa_pmids():
-    try:
-        conn = psycopg2.connect(**db_params)
-        cursor = conn.cursor()
-
-        # Get pmids for closed access works
-        cursor.execute(
-            """
-            SELECT o.work_id
-            FROM openalex_works_open_access o
-            WHERE o.is_oa = FALSE
-        """
-        )
-        work_ids = cursor.fetchall()
-
-        # Get pmids and dois for these works
-        cursor.execute(
-            """
-            SELECT i.pmid, i.doi
-            FROM openalex_works_ids i
-            WHERE i.work_id IN %s
-        """,
-            (tuple(work_ids),),
-        )
-        id_values = cursor.fetchall()
-
-        id_url_df = pd.DataFrame(id_values, columns=["PMID", "DOI"])
-        id_url_df.to_csv(NOT_OA_PATH, index=False)
-
-    except psycopg2.Error as e:
-        print("Error:", e)
-    finally:
-        cursor.close()
-        conn.close()
+def main():
+    parser = argparse.ArgumentParser(
+        description="Export open access URLs and closed access ids"
+    )
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv")
+    args = parser.parse_args()
+    export_oa(args.format)
 
 
 if __name__ == "__main__":
-    get_oa_urls()
-    get_not_oa_pmids()
+    main()
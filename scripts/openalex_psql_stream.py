@@ -0,0 +1,502 @@
+import argparse
+import csv
+import glob
+import gzip
+import hashlib
+import io
+import json
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+
+import psycopg2
+from dotenv import load_dotenv
+from openalex_flatten_works import (
+    SNAPSHOT_DIR,
+    csv_files,
+    flatten_work,
+    loads,
+    table_name,
+)
+from openalex_psql_insert import build_indexes
+
+"""
+Loads the OpenAlex works snapshot straight into the openalex_works* tables
+Works are flattened in memory and streamed to one COPY per table, each on
+its own connection and thread, without writing csv files
+Each table buffers at most a few chunks, and every table commits once per
+input file; each commit is recorded in the state file, so a rerun skips the
+files loaded by all tables and loads a partly loaded file only into the
+tables that had not committed it
+Keys and indexes are built after the load, followed by ANALYZE
+--debug-csv also writes the streamed rows to csv.gz files
+With --incremental, only updated_date= partition files not yet recorded in
+openalex_sync_state are loaded, in date order. Each file's works replace
+the rows already loaded for the same work ids in every table, and the
+snapshot manifest, when present, lists the files to load
+"""
+
+DATA_PATH = Path("./delme_data")
+STATE_FILE_PATH = DATA_PATH / "openalex_stream_loaded.txt"
+CHUNK_BYTES = 4 * 2**20
+# chunks buffered per table before the parser waits for the database
+MAX_CHUNKS = 2
+
+_FILE_END = object()
+_STOP = object()
+
+SYNC_STATE_SQL = """
+CREATE TABLE IF NOT EXISTS openalex_sync_state (
+    file text PRIMARY KEY,
+    record_count bigint,
+    loaded_at timestamptz NOT NULL DEFAULT now()
+);
+CREATE TABLE IF NOT EXISTS openalex_sync_manifests (
+    sha256 text PRIMARY KEY,
+    files integer,
+    loaded_at timestamptz NOT NULL DEFAULT now()
+);
+"""
+
+
+class FileTracker:
+    """
+    Record input files per table as each table commits them. A file that
+    failed in some tables is only loaded again into the tables that had
+    not committed it, so no table gets its rows twice.
+    """
+
+    def __init__(self, state_file: Path, tables: int):
+        self.state_file = state_file
+        self.tables = tables
+        self.loaded = set()
+        self._done: dict[str, set[str]] = {}
+        if state_file.exists():
+            # "file" once every table has it, "file<TAB>table" per table
+            for line in state_file.read_text().splitlines():
+                file_name, _, table = line.partition("\t")
+                if table:
+                    self._done.setdefault(file_name, set()).add(table)
+                elif file_name:
+                    self.loaded.add(file_name)
+        self._lock = threading.Lock()
+
+    def key(self, jsonl_file_name: str) -> str:
+        return jsonl_file_name
+
+    def table_loaded(self, file_name: str, table: str) -> bool:
+        return file_name in self.loaded or table in self._done.get(
+            file_name, ()
+        )
+
+    def committed(self, file_name: str, table: str) -> None:
+        with self._lock:
+            done = self._done.setdefault(file_name, set())
+            done.add(table)
+            self._record_table(file_name, table)
+            if len(done) == self.tables:
+                del self._done[file_name]
+                self.loaded.add(file_name)
+                self._record(file_name)
+
+    def _record_table(self, file_name: str, table: str) -> None:
+        with open(self.state_file, "a") as f:
+            f.write(f"{file_name}\t{table}\n")
+
+    def _record(self, file_name: str) -> None:
+        with open(self.state_file, "a") as f:
+            f.write(f"{file_name}\n")
+
+
+class SyncStateTracker(FileTracker):
+    """
+    Record loaded files in openalex_sync_state, keyed by their path under
+    the works directory (updated_date=YYYY-MM-DD/part_NNN.gz).
+    """
+
+    def __init__(self, db_params: dict, tables: int, works_dir: Path):
+        self.tables = tables
+        self.works_dir = works_dir
+        self.record_counts: dict[str, int] = {}
+        self._done = {}
+        self._lock = threading.Lock()
+        self._conn = psycopg2.connect(**db_params)
+        with self._conn, self._conn.cursor() as cursor:
+            cursor.execute(SYNC_STATE_SQL)
+            cursor.execute("SELECT file FROM openalex_sync_state")
+            self.loaded = {file for (file,) in cursor.fetchall()}
+
+    def key(self, jsonl_file_name: str) -> str:
+        return Path(jsonl_file_name).relative_to(self.works_dir).as_posix()
+
+    def _record_table(self, file_name: str, table: str) -> None:
+        # the upsert replaces a file's works, so reloading it is harmless
+        pass
+
+    def _record(self, file_name: str) -> None:
+        with self._conn, self._conn.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO openalex_sync_state (file, record_count)"
+                " VALUES (%s, %s) ON CONFLICT (file) DO UPDATE"
+                " SET record_count = EXCLUDED.record_count, loaded_at = now()",
+                (file_name, self.record_counts.get(file_name)),
+            )
+
+    def manifest_loaded(self, sha256: str) -> bool:
+        with self._conn, self._conn.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM openalex_sync_manifests WHERE sha256 = %s",
+                (sha256,),
+            )
+            return cursor.fetchone() is not None
+
+    def record_manifest(self, sha256: str, files: int) -> None:
+        with self._conn, self._conn.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO openalex_sync_manifests (sha256, files)"
+                " VALUES (%s, %s) ON CONFLICT DO NOTHING",
+                (sha256, files),
+            )
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class TableLoader(threading.Thread):
+    """
+    COPY the csv chunks of one table over a dedicated connection. The queue
+    carries (csv chunk, row count) items, and (_FILE_END, (file name, work
+    ids)) once an input file is complete.
+
+    With ``upsert``, chunks are copied into a temporary staging table and,
+    at the end of each file, the table's rows for the file's work ids are
+    deleted and replaced by the staged rows in the same transaction.
+    """
+
+    def __init__(
+        self,
+        table: str,
+        db_params: dict,
+        tracker: FileTracker,
+        debug_csv: Path | None = None,
+        upsert: bool = False,
+    ):
+        super().__init__(name=table, daemon=True)
+        self.table = table
+        self.upsert = upsert
+        self.db_params = db_params
+        self.tracker = tracker
+        self.debug_csv = debug_csv
+        self.chunks: queue.Queue = queue.Queue(maxsize=MAX_CHUNKS)
+        self.error: Exception | None = None
+        self.rows = 0
+        self.columns = ", ".join(csv_files["works"][table]["columns"])
+        self.target = table_name(table)
+        if upsert:
+            self.target = f"stage_{table_name(table)}"
+        self.copy_sql = (
+            f"COPY {self.target} ({self.columns}) FROM STDIN WITH (FORMAT CSV)"
+        )
+
+    def run(self):
+        conn = debug_file = None
+        try:
+            conn = psycopg2.connect(**self.db_params)
+            if self.debug_csv:
+                debug_file = gzip.open(
+                    self.debug_csv / f"{table_name(self.table)}.csv.gz",
+                    "at",
+                    encoding="utf-8",
+                    compresslevel=1,
+                )
+            with conn.cursor() as cursor:
+                if self.upsert:
+                    cursor.execute(
+                        f"CREATE TEMP TABLE {self.target}"
+                        f" (LIKE {table_name(self.table)})"
+                        " ON COMMIT DELETE ROWS"
+                    )
+                while (item := self.chunks.get()) is not _STOP:
+                    chunk, value = item
+                    if chunk is _FILE_END:
+                        file_name, work_ids = value
+                        if self.upsert:
+                            self._replace(cursor, work_ids)
+                        conn.commit()
+                        self.tracker.committed(file_name, self.table)
+                        continue
+                    cursor.copy_expert(self.copy_sql, io.StringIO(chunk))
+                    self.rows += value
+                    if debug_file:
+                        debug_file.write(chunk)
+        except Exception as e:
+            self.error = e
+            if conn:
+                conn.rollback()
+            # keep draining so the parser never blocks on a full queue
+            while self.chunks.get() is not _STOP:
+                pass
+        finally:
+            if debug_file:
+                debug_file.close()
+            if conn:
+                conn.close()
+
+    def _replace(self, cursor, work_ids: list[str]) -> None:
+        """Replace the rows of the staged works with the staged rows."""
+        key = "id" if self.table == "works" else "work_id"
+        cursor.execute(
+            f"DELETE FROM {table_name(self.table)} WHERE {key} = ANY(%s)",
+            (work_ids,),
+        )
+        cursor.execute(
+            f"INSERT INTO {table_name(self.table)} ({self.columns})"
+            f" SELECT {self.columns} FROM {self.target}"
+        )
+
+
+class TableStream:
+    """csv writer for flatten_work that hands full chunks to a loader."""
+
+    def __init__(self, loader: TableLoader, chunk_bytes: int):
+        self.loader = loader
+        self.chunk_bytes = chunk_bytes
+        # set for input files this table has already committed
+        self.skip = False
+        self._new_buffer()
+
+    def _new_buffer(self):
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer)
+        self._rows = 0
+
+    def writerow(self, row):
+        if self.skip:
+            return
+        self._writer.writerow(row)
+        self._rows += 1
+        if self._buffer.tell() >= self.chunk_bytes:
+            self.flush()
+
+    def flush(self):
+        if self._rows:
+            self.loader.chunks.put((self._buffer.getvalue(), self._rows))
+            self._new_buffer()
+
+    def end_file(self, file_name: str, work_ids: list[str]):
+        if self.skip:
+            return
+        self.flush()
+        self.loader.chunks.put((_FILE_END, (file_name, work_ids)))
+
+
+def stream_works(
+    jsonl_file_names: list[str],
+    db_params: dict,
+    tracker: FileTracker,
+    chunk_bytes: int = CHUNK_BYTES,
+    debug_csv: Path | None = None,
+    upsert: bool = False,
+) -> None:
+    loaders = {
+        table: TableLoader(table, db_params, tracker, debug_csv, upsert)
+        for table in csv_files["works"]
+    }
+    streams = {
+        table: TableStream(loader, chunk_bytes)
+        for table, loader in loaders.items()
+    }
+    for loader in loaders.values():
+        loader.start()
+
+    start = time.perf_counter()
+    try:
+        for jsonl_file_name in jsonl_file_names:
+            file_name = tracker.key(jsonl_file_name)
+            if file_name in tracker.loaded:
+                continue
+            print(jsonl_file_name)
+            for table, stream in streams.items():
+                stream.skip = tracker.table_loaded(file_name, table)
+            work_ids = []
+            with gzip.open(jsonl_file_name, "r") as works_jsonl:
+                for work_json in works_jsonl:
+                    if not work_json.strip():
+                        continue
+                    work = loads(work_json)
+                    if work_id := work.get("id"):
+                        work_ids.append(work_id)
+                    flatten_work(work, streams)
+            for stream in streams.values():
+                stream.end_file(file_name, work_ids)
+            if errors := [ld.error for ld in loaders.values() if ld.error]:
+                raise errors[0]
+    finally:
+        for loader in loaders.values():
+            loader.chunks.put(_STOP)
+        for loader in loaders.values():
+            loader.join()
+
+    if errors := [ld for ld in loaders.values() if ld.error]:
+        raise errors[0].error
+    elapsed = time.perf_counter() - start
+    for table, loader in loaders.items():
+        print(
+            f"{table_name(table)}: {loader.rows} rows "
+            f"({loader.rows / elapsed:,.0f} rows/s)"
+        )
+
+
+def read_manifest(works_dir: Path) -> tuple[str, dict[str, int]] | None:
+    """
+    Return the sha256 of the snapshot manifest and the record count of
+    every file it lists, keyed by path under the works directory.
+    """
+    manifest_file = works_dir / "manifest"
+    if not manifest_file.exists():
+        return None
+    content = manifest_file.read_bytes()
+    record_counts = {}
+    for entry in json.loads(content)["entries"]:
+        # s3://openalex/data/works/updated_date=2024-01-01/part_000.gz
+        file_name = entry["url"].split("/works/", 1)[1]
+        record_counts[file_name] = entry.get("meta", {}).get("record_count")
+    return hashlib.sha256(content).hexdigest(), record_counts
+
+
+def create_indexes(db_params: dict) -> None:
+    conn = psycopg2.connect(**db_params)
+    try:
+        build_indexes(conn)
+    finally:
+        conn.close()
+
+
+def sync_works(
+    works_dir: Path,
+    db_params: dict,
+    chunk_bytes: int = CHUNK_BYTES,
+    debug_csv: Path | None = None,
+) -> None:
+    """Load the partition files not yet in openalex_sync_state."""
+    tracker = SyncStateTracker(db_params, len(csv_files["works"]), works_dir)
+    try:
+        if manifest := read_manifest(works_dir):
+            sha256, record_counts = manifest
+            if tracker.manifest_loaded(sha256):
+                print("Snapshot manifest already loaded")
+                return
+            tracker.record_counts = record_counts
+            missing = [
+                name
+                for name in record_counts
+                if not (works_dir / name).exists()
+            ]
+            if missing:
+                raise FileNotFoundError(
+                    f"{len(missing)} manifest files are missing, e.g. "
+                    f"{missing[0]}"
+                )
+            jsonl_file_names = [
+                str(works_dir / name) for name in record_counts
+            ]
+        else:
+            jsonl_file_names = glob.glob(
+                str(works_dir / "**" / "*.gz"), recursive=True
+            )
+
+        # updated_date= partitions sort chronologically, so the latest
+        # version of a work is applied last
+        jsonl_file_names.sort()
+        # the per-file DELETEs look works up by the work_id indexes
+        create_indexes(db_params)
+        print(
+            f"{sum(tracker.key(f) not in tracker.loaded for f in jsonl_file_names)}"
+            f" of {len(jsonl_file_names)} files to load"
+        )
+        stream_works(
+            jsonl_file_names,
+            db_params,
+            tracker,
+            chunk_bytes,
+            debug_csv,
+            upsert=True,
+        )
+        if manifest:
+            tracker.record_manifest(sha256, len(jsonl_file_names))
+    finally:
+        tracker.close()
+    # refresh the planner statistics for the replaced works
+    create_indexes(db_params)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Stream the OpenAlex works snapshot into Postgres"
+    )
+    parser.add_argument(
+        "-i",
+        "--input",
+        default=os.path.join(SNAPSHOT_DIR, "works", "**", "*.gz"),
+        help="Glob of the works .gz files",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only load new partitions of the snapshot, replacing works",
+    )
+    parser.add_argument(
+        "--works-dir",
+        type=Path,
+        default=SNAPSHOT_DIR / "works",
+        help="Snapshot works directory used by --incremental",
+    )
+    parser.add_argument(
+        "--state-file",
+        type=Path,
+        default=STATE_FILE_PATH,
+        help="File listing the input files already loaded",
+    )
+    parser.add_argument(
+        "--chunk-mb",
+        type=float,
+        default=CHUNK_BYTES / 2**20,
+        help="Size of the csv chunks sent with each COPY",
+    )
+    parser.add_argument(
+        "--debug-csv",
+        type=Path,
+        help="Also write the loaded rows to csv.gz files in this directory",
+    )
+    args = parser.parse_args()
+
+    load_dotenv()
+    db_params = {
+        "dbname": os.getenv("POSTGRES_NAME"),
+        "user": os.getenv("POSTGRES_USER"),
+        "password": os.getenv("POSTGRES_PASSWORD"),
+        "host": os.getenv("POSTGRES_HOST"),
+        "port": os.getenv("POSTGRES_PORT"),
+    }
+    if args.debug_csv:
+        os.makedirs(args.debug_csv, exist_ok=True)
+
+    chunk_bytes = int(args.chunk_mb * 2**20)
+    if args.incremental:
+        sync_works(args.works_dir, db_params, chunk_bytes, args.debug_csv)
+        return
+
+    stream_works(
+        sorted(glob.glob(args.input, recursive=True)),
+        db_params,
+        FileTracker(args.state_file, len(csv_files["works"])),
+        chunk_bytes,
+        args.debug_csv,
+    )
+    create_indexes(db_params)
+
+
+if __name__ == "__main__":
+    main()
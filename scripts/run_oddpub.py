@@ -6,10 +6,25 @@ from dsst_etl.oddpub_wrapper import OddpubWrapper
 def main():
     parser = argparse.ArgumentParser(description="Process PDFs with OddpubWrapper")
     parser.add_argument('pdf_folder', type=str, help='Path to the folder containing PDF files')
+    parser.add_argument(
+        '--text',
+        action='store_true',
+        help='Folder holds pre-extracted .txt/.txt.gz files (e.g. from pdfs_to_text.py)',
+    )
+    parser.add_argument('--workers', type=int, default=4, help='Number of concurrent requests to the ODDPub service (each service process analyses one file at a time)')
+    parser.add_argument('--batch-size', type=int, default=50, help='Number of results committed to the database at once')
+    parser.add_argument('--resume', action='store_true', help='Only send files whose article name has no ODDPub results yet')
     args = parser.parse_args()
 
-    oddpubWrapper = OddpubWrapper(get_db_session(get_db_engine()))
-    oddpubWrapper.process_pdfs(args.pdf_folder)
+    oddpubWrapper = OddpubWrapper(
+        get_db_session(get_db_engine()),
+        max_workers=args.workers,
+        batch_size=args.batch_size,
+    )
+    if args.text:
+        oddpubWrapper.process_texts(args.pdf_folder, resume=args.resume)
+    else:
+        oddpubWrapper.process_pdfs(args.pdf_folder, resume=args.resume)
 
 if __name__ == "__main__":
     main()
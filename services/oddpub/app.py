@@ -1,6 +1,13 @@
+import gzip
+import hashlib
+import json
 import logging
+import sqlite3
+import tempfile
+import threading
+import time
 from pathlib import Path
-from typing import Dict, List
+from typing import List
 
 import pandas as pd
 from fastapi import FastAPI, File, UploadFile
@@ -10,7 +17,7 @@ import os
 import rpy2.robjects as robjects
 from rpy2.robjects import pandas2ri
 from rpy2.robjects.packages import importr
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, asdict, fields
 
 # Configure logging
 logging.basicConfig(
@@ -23,6 +30,104 @@ logger = logging.getLogger(__name__)
 
 app = FastAPI()
 
+# The oddpub git ref installed in the image (see dockerfile); part of the cache
+# key so results are recomputed whenever oddpub is upgraded.
+ODDPUB_GIT_REF = os.environ.get("ODDPUB_GIT_REF", "unknown")
+CACHE_PATH = os.environ.get("ODDPUB_CACHE_PATH", "/tmp/oddpub_cache.sqlite3")
+CACHE_MAX_ENTRIES = int(os.environ.get("ODDPUB_CACHE_MAX_ENTRIES", "100000"))
+
+# FastAPI runs the endpoints in a thread pool, but embedded R is not
+# thread-safe: only one request at a time may call into it.
+R_LOCK = threading.Lock()
+
+
+class ResultCache:
+    """
+    SQLite-backed LRU cache of oddpub results keyed by the sha256 of the
+    uploaded content, the input kind (pdf or text) and the oddpub git ref.
+    """
+
+    def __init__(self, path: str, oddpub_ref: str, max_entries: int):
+        self.oddpub_ref = oddpub_ref
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS results (
+                    content_hash TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    oddpub_ref TEXT NOT NULL,
+                    result TEXT NOT NULL,
+                    last_access REAL NOT NULL,
+                    PRIMARY KEY (content_hash, kind, oddpub_ref)
+                )
+                """
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS results_last_access_idx "
+                "ON results (last_access)"
+            )
+
+    def get(self, content_hash: str, kind: str):
+        """Return the cached result, or None on a miss."""
+        key = (content_hash, kind, self.oddpub_ref)
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT result FROM results "
+                "WHERE content_hash = ? AND kind = ? AND oddpub_ref = ?",
+                key,
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute(
+                "UPDATE results SET last_access = ? "
+                "WHERE content_hash = ? AND kind = ? AND oddpub_ref = ?",
+                (time.time(), *key),
+            )
+        return json.loads(row[0])
+
+    def put(self, content_hash: str, kind: str, result) -> None:
+        """Store a result and evict the least recently used entries."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                (
+                    content_hash,
+                    kind,
+                    self.oddpub_ref,
+                    json.dumps(result),
+                    time.time(),
+                ),
+            )
+            self._conn.execute(
+                "DELETE FROM results WHERE rowid IN ("
+                "SELECT rowid FROM results ORDER BY last_access DESC "
+                "LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def stats(self) -> dict:
+        with self._lock:
+            (entries,) = self._conn.execute(
+                "SELECT COUNT(*) FROM results"
+            ).fetchone()
+            return {
+                "oddpub_ref": self.oddpub_ref,
+                "entries": entries,
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+result_cache = ResultCache(CACHE_PATH, ODDPUB_GIT_REF, CACHE_MAX_ENTRIES)
+
 
 @dataclass
 class OddpubMetrics:
@@ -47,6 +152,11 @@ class OddpubMetrics:
         return asdict(self)
 
 
+def _r_folder(folder: str) -> str:
+    """oddpub builds file paths with paste0(folder, name): keep the slash."""
+    return os.path.join(str(Path(folder)), "")
+
+
 class OddpubWrapper:
     """
     A wrapper class for calling ODDPub R functions from Python using rpy2.
@@ -76,7 +186,7 @@ class OddpubWrapper:
             r_output_folder = robjects.StrVector([str(Path(output_folder))])
 
             logger.info(f"Converting PDFs from {r_pdf_folder} to text in {r_output_folder}")
-            self.oddpub.pdf_convert(pdf_folder, output_folder)
+            self.oddpub.pdf_convert(_r_folder(pdf_folder), _r_folder(output_folder))
             logger.info(
                 f"Successfully converted PDFs from {pdf_folder} to text in {output_folder}"
             )
@@ -87,7 +197,7 @@ class OddpubWrapper:
     def _load_pdf_text(self, pdf_text_folder: str) -> robjects.vectors.ListVector:
         """Load converted PDF text using oddpub::pdf_load."""
         try:
-            pdf_text_sentences = self.oddpub.pdf_load(pdf_text_folder)
+            pdf_text_sentences = self.oddpub.pdf_load(_r_folder(pdf_text_folder))
             logger.info(f"Successfully loaded PDF text from {pdf_text_folder}")
             return pdf_text_sentences
         except Exception as e:
@@ -116,20 +226,18 @@ class OddpubWrapper:
             logger.error(f"Error cleaning up output folder: {str(e)}")
             raise
 
-    def process_pdfs(self, pdf_folder: str) -> Dict:
+    def process_pdfs(self, pdf_folder: str) -> List[OddpubMetrics]:
         """
         Process PDFs through the complete ODDPub workflow and store results in database.
         Args:
             pdf_folder (str): Path to folder containing PDF files
-            output_folder (str): Path to temporary output folder for converted text files
         Returns:
-            OddpubMetrics: Results of open data analysis
+            List[OddpubMetrics]: Results of open data analysis, one per article
         """
+        # A fresh output folder per call, so concurrent requests never load
+        # or delete each other's converted text
+        output_folder = tempfile.mkdtemp(prefix="oddpub_output_")
         try:
-            # Create output directory if it doesn't exist
-            output_folder = "oddpub_output/"
-            Path(output_folder).mkdir(parents=True, exist_ok=True)
-
             # Execute the workflow
             logger.info(f"Converting PDFs from {pdf_folder} to text in {output_folder}")
 
@@ -144,47 +252,144 @@ class OddpubWrapper:
             # Attempt cleanup even if processing failed
             self._cleanup_output_folder(output_folder)
 
-    def _convert_r_result(self, r_result) -> OddpubMetrics:
-        """Convert R results to OddpubMetrics instance."""
+    def process_texts(self, text_folder: str) -> List[OddpubMetrics]:
+        """
+        Process already extracted text files, skipping oddpub::pdf_convert.
+        Args:
+            text_folder (str): Path to folder containing .txt files
+        Returns:
+            List[OddpubMetrics]: Results of open data analysis, one per article
+        """
         try:
-            df = pandas2ri.rpy2py(r_result)
-            result_dict = df.to_dict("records")[0] if not df.empty else {}
-
-            # Create new OddpubMetrics instance with relationships
-            oddpub_metrics = OddpubMetrics(
-                article=result_dict.get("article"),
-                is_open_data=result_dict.get("is_open_data", False),
-                open_data_category=result_dict.get("open_data_category"),
-                is_reuse=result_dict.get("is_reuse", False),
-                is_open_code=result_dict.get("is_open_code", False),
-                is_open_data_das=result_dict.get("is_open_data_das", False),
-                is_open_code_cas=result_dict.get("is_open_code_cas", False),
-                das=result_dict.get("das"),
-                open_data_statements=result_dict.get("open_data_statements"),
-                cas=result_dict.get("cas"),
-                open_code_statements=result_dict.get("open_code_statements"),
+            logger.info(f"Loading pre-extracted text from {text_folder}")
+            pdf_text_sentences = self._load_pdf_text(text_folder)
+            return self._search_open_data(pdf_text_sentences)
+        except Exception as e:
+            logger.error(f"Error in text processing workflow: {str(e)}")
+
+    def _convert_r_result(self, r_result) -> List[OddpubMetrics]:
+        """
+        Convert the R data.frame returned by open_data_search to one
+        OddpubMetrics per article, converting column by column.
+        """
+        try:
+            df = (
+                r_result
+                if isinstance(r_result, pd.DataFrame)
+                else pandas2ri.rpy2py(r_result)
             )
-            return oddpub_metrics
+            n_rows = len(df)
+
+            columns = []
+            for field in fields(OddpubMetrics):
+                is_bool = field.type is bool
+                if field.name not in df.columns:
+                    columns.append([False if is_bool else None] * n_rows)
+                    continue
+                column = df[field.name]
+                values = column.astype(object).where(column.notna(), None)
+                cast = bool if is_bool else str
+                columns.append(
+                    [None if value is None else cast(value) for value in values]
+                )
+
+            return [OddpubMetrics(*row) for row in zip(*columns)]
         except Exception as e:
             logger.error(f"Error converting R result: {str(e)}")
             raise
 
 
+def _cached_response(content: bytes, kind: str, filename: str):
+    """
+    Look up a previous result for identical content. The article name is
+    taken from the current upload, since the same document can arrive under
+    different filenames.
+    """
+    content_hash = hashlib.sha256(content).hexdigest()
+    cached = result_cache.get(content_hash, kind)
+    if cached is None:
+        return content_hash, None
+
+    logger.info(f"Cache hit for {filename} ({content_hash})")
+    for row in cached:
+        row["article"] = f"{Path(filename).stem}.txt"
+    return content_hash, JSONResponse(
+        content=cached, headers={"X-Oddpub-Cache": "hit"}
+    )
+
+
+def _result_response(
+    result: List[OddpubMetrics], content_hash: str, kind: str, filename: str
+) -> JSONResponse:
+    """
+    Return every per-article row; only the row for the uploaded file is
+    cached, since other rows belong to other uploads.
+    """
+    serialized = [oddpub_metrics.serialize() for oddpub_metrics in result]
+    article = f"{Path(filename).stem}.txt"
+    own_rows = [row for row in serialized if row["article"] == article]
+    if own_rows:
+        result_cache.put(content_hash, kind, own_rows)
+    return JSONResponse(content=serialized, headers={"X-Oddpub-Cache": "miss"})
+
+
 @app.post("/oddpub")
 def process_pdf(file: UploadFile = File(...)):
-    pdf_folder = "/tmp/pdfs/"
-    Path(pdf_folder).mkdir(parents=True, exist_ok=True) 
+    content = file.file.read()
+    content_hash, cached_response = _cached_response(content, "pdf", file.filename)
+    if cached_response is not None:
+        return cached_response
+
+    # Each request converts only its own PDF, from its own folder
+    with tempfile.TemporaryDirectory(prefix="oddpub_pdfs_") as pdf_folder:
+        file_location = Path(pdf_folder) / Path(file.filename).name
+        logger.info(f"Saving file to {file_location}")
+        file_location.write_bytes(content)
+
+        with R_LOCK:
+            oddpub_wrapper = OddpubWrapper()
+            result = oddpub_wrapper.process_pdfs(pdf_folder)
+
+    return _result_response(result, content_hash, "pdf", file.filename)
+
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+@app.post("/oddpub/text")
+def process_text(file: UploadFile = File(...)):
+    """
+    Run oddpub on text already extracted with pdftotext.
+
+    The upload may be plain text or gzip-compressed (detected from the
+    content, so a ``.txt.gz`` name is not required).
+    """
+    content = file.file.read()
+    if content[:2] == GZIP_MAGIC:
+        content = gzip.decompress(content)
+
+    filename = Path(file.filename).name
+    if filename.endswith(".gz"):
+        filename = filename[: -len(".gz")]
+    filename = f"{Path(filename).stem}.txt"
 
-    file_location = f"{pdf_folder}/{file.filename}"
-    logger.info(f"Saving file to {file_location}")  
+    content_hash, cached_response = _cached_response(content, "text", filename)
+    if cached_response is not None:
+        return cached_response
 
-    with open(file_location, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    with tempfile.TemporaryDirectory(prefix="oddpub_text_") as text_folder:
+        file_location = Path(text_folder) / filename
+        logger.info(f"Saving text to {file_location}")
+        file_location.write_bytes(content)
 
-    oddpub_wrapper = OddpubWrapper()
+        with R_LOCK:
+            oddpub_wrapper = OddpubWrapper()
+            result = oddpub_wrapper.process_texts(text_folder)
 
-    result = oddpub_wrapper.process_pdfs(pdf_folder)
+    return _result_response(result, content_hash, "text", filename)
 
-    os.remove(file_location)
 
-    return JSONResponse(content=result.serialize())
+@app.get("/cache/stats")
+def cache_stats():
+    """Report result cache hit and miss counters."""
+    return JSONResponse(content=result_cache.stats())
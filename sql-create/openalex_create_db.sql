@@ -156,10 +156,23 @@ CREATE TABLE openalex_works_related_works (
     related_work_id text
 );
 
-CREATE INDEX works_primary_locations_work_id_idx ON openalex_works_primary_locations USING btree (work_id);
+--
+-- Name: sync_state; Type: TABLE; snapshot files and manifests loaded by
+-- openalex_psql_stream.py --incremental
+--
 
-CREATE INDEX works_locations_work_id_idx ON openalex_works_locations USING btree (work_id);
+CREATE TABLE openalex_sync_state (
+    file text PRIMARY KEY,
+    record_count bigint,
+    loaded_at timestamptz NOT NULL DEFAULT now()
+);
+
+CREATE TABLE openalex_sync_manifests (
+    sha256 text PRIMARY KEY,
+    files integer,
+    loaded_at timestamptz NOT NULL DEFAULT now()
+);
 
-CREATE INDEX works_best_oa_locations_work_id_idx ON openalex_works_best_oa_locations USING btree (work_id);
+-- Keys and indexes are built after loading, see openalex_create_indexes.sql
 
 COMMIT;
\ No newline at end of file
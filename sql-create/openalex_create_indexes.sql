@@ -0,0 +1,68 @@
+-- Keys and indexes of the openalex_works* tables.
+-- Run after bulk loading (openalex_psql_insert.py and openalex_psql_stream.py
+-- do), since maintaining indexes during COPY is much slower than building
+-- them once. Statements are idempotent, and ANALYZE refreshes the planner
+-- statistics for the loaded data.
+BEGIN;
+
+-- Tables loaded more than once before the key existed hold duplicate
+-- works (and child rows), which cannot be told apart, so stop with a hint
+-- instead of failing on the ALTER TABLE.
+DO $$
+DECLARE
+    duplicates bigint;
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_constraint WHERE conname = 'openalex_works_pkey'
+    ) THEN
+        SELECT count(*) INTO duplicates FROM (
+            SELECT id FROM openalex_works GROUP BY id HAVING count(*) > 1
+        ) AS duplicated;
+        IF duplicates > 0 THEN
+            RAISE EXCEPTION 'openalex_works has % duplicated ids, so its primary key cannot be added', duplicates
+                USING HINT = 'The openalex_works* tables were loaded more than once. Load the snapshot again with openalex_psql_insert.py --replace.';
+        END IF;
+        ALTER TABLE openalex_works ADD CONSTRAINT openalex_works_pkey PRIMARY KEY (id);
+    END IF;
+END $$;
+
+CREATE INDEX IF NOT EXISTS works_primary_locations_work_id_idx ON openalex_works_primary_locations USING btree (work_id);
+
+CREATE INDEX IF NOT EXISTS works_locations_work_id_idx ON openalex_works_locations USING btree (work_id);
+
+CREATE INDEX IF NOT EXISTS works_best_oa_locations_work_id_idx ON openalex_works_best_oa_locations USING btree (work_id);
+
+CREATE INDEX IF NOT EXISTS works_authorships_work_id_idx ON openalex_works_authorships USING btree (work_id);
+
+CREATE INDEX IF NOT EXISTS works_biblio_work_id_idx ON openalex_works_biblio USING btree (work_id);
+
+CREATE INDEX IF NOT EXISTS works_concepts_work_id_idx ON openalex_works_concepts USING btree (work_id);
+
+CREATE INDEX IF NOT EXISTS works_ids_work_id_idx ON openalex_works_ids USING btree (work_id);
+
+CREATE INDEX IF NOT EXISTS works_ids_pmid_idx ON openalex_works_ids USING btree (pmid);
+
+CREATE INDEX IF NOT EXISTS works_ids_doi_idx ON openalex_works_ids USING btree (doi);
+
+CREATE INDEX IF NOT EXISTS works_mesh_work_id_idx ON openalex_works_mesh USING btree (work_id);
+
+CREATE INDEX IF NOT EXISTS works_open_access_work_id_idx ON openalex_works_open_access USING btree (work_id);
+
+CREATE INDEX IF NOT EXISTS works_referenced_works_work_id_idx ON openalex_works_referenced_works USING btree (work_id);
+
+CREATE INDEX IF NOT EXISTS works_related_works_work_id_idx ON openalex_works_related_works USING btree (work_id);
+
+COMMIT;
+
+ANALYZE openalex_works;
+ANALYZE openalex_works_primary_locations;
+ANALYZE openalex_works_locations;
+ANALYZE openalex_works_best_oa_locations;
+ANALYZE openalex_works_authorships;
+ANALYZE openalex_works_biblio;
+ANALYZE openalex_works_concepts;
+ANALYZE openalex_works_ids;
+ANALYZE openalex_works_mesh;
+ANALYZE openalex_works_open_access;
+ANALYZE openalex_works_referenced_works;
+ANALYZE openalex_works_related_works;
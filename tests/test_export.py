@@ -0,0 +1,72 @@
+import csv
+
+import pyarrow.parquet as pq
+
+from dsst_etl.export import RowWriter, export_query, stream_query
+
+
+class FakeColumn:
+    def __init__(self, name):
+        self.name = name
+
+
+class FakeNamedCursor:
+    """Minimal psycopg2 named cursor serving fixed rows."""
+
+    def __init__(self, rows, columns):
+        self._rows = rows
+        self.description = [FakeColumn(column) for column in columns]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def execute(self, query, params=None):
+        self._position = 0
+
+    def fetchmany(self, size):
+        batch = self._rows[self._position : self._position + size]
+        self._position += size
+        return batch
+
+
+class FakeConnection:
+    def __init__(self, rows, columns):
+        self.rows = rows
+        self.columns = columns
+        self.cursor_names = []
+
+    def cursor(self, name=None):
+        self.cursor_names.append(name)
+        return FakeNamedCursor(self.rows, self.columns)
+
+
+def test_stream_query_uses_a_named_cursor_and_batches():
+    conn = FakeConnection([(i,) for i in range(5)], ["n"])
+    batches = list(stream_query(conn, "SELECT n FROM t", batch_size=2))
+    assert batches == [[(0,), (1,)], [(2,), (3,)], [(4,)]]
+    assert conn.cursor_names[0] is not None
+
+
+def test_row_writer_csv(tmp_path):
+    path = tmp_path / "out.csv"
+    with RowWriter(path, ["PMID", "DOI"]) as writer:
+        writer.write([("1", "10.1/a"), ("2", None)])
+    with open(path) as f:
+        assert list(csv.reader(f)) == [["PMID", "DOI"], ["1", "10.1/a"], ["2", ""]]
+
+
+def test_export_query_to_parquet_infers_types(tmp_path):
+    rows = [(1, True, None), (2, False, None), (3, None, "x")]
+    conn = FakeConnection(rows, ["id", "is_oa", "url"])
+    path = tmp_path / "out.parquet"
+
+    assert export_query(conn, "SELECT ...", path, batch_size=2) == 3
+
+    table = pq.read_table(path)
+    assert table.column_names == ["id", "is_oa", "url"]
+    assert str(table.schema.field("is_oa").type) == "bool"
+    # the first batch only had nulls, so url is typed as text
+    assert table.column("url").to_pylist() == [None, None, "x"]
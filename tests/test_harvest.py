@@ -0,0 +1,27 @@
+from dsst_etl.harvest import TokenBucket, retry_delay
+
+
+def test_token_bucket_allows_burst_then_spaces_requests():
+    bucket = TokenBucket(rate=10, capacity=2)
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    # The third request has to wait for one token to refill
+    assert 0.05 < bucket.reserve() <= 0.1
+
+
+def test_token_bucket_penalize_and_reward():
+    bucket = TokenBucket(rate=10)
+    bucket.penalize()
+    assert bucket.rate == 5
+    # A second 429 from the same burst does not halve the rate again
+    bucket.penalize()
+    assert bucket.rate == 5
+    for _ in range(100):
+        bucket.reward()
+    assert bucket.rate == 10
+
+
+def test_retry_delay_prefers_retry_after():
+    assert retry_delay(1, "3") == 3
+    assert 1 <= retry_delay(1) <= 2
+    assert retry_delay(10) <= 60
@@ -0,0 +1,92 @@
+import os
+from unittest import mock
+
+import requests
+
+from dsst_etl.http_cache import CachedSession, ResponseCache
+
+
+def test_key_merges_params_into_url():
+    assert ResponseCache.key("GET", "https://x.org/a?b=1") == ResponseCache.key(
+        "get", "https://x.org/a", {"b": 1}
+    )
+    assert ResponseCache.key("GET", "https://x.org/a") != ResponseCache.key(
+        "POST", "https://x.org/a"
+    )
+    assert ResponseCache.key("POST", "https://x.org/a", body=b"1") != (
+        ResponseCache.key("POST", "https://x.org/a", body=b"2")
+    )
+
+
+def test_response_cache_round_trip_and_ttl(tmp_path):
+    cache = ResponseCache(tmp_path, ttl=60)
+    key = ResponseCache.key("GET", "https://x.org/a")
+    assert cache.get(key) is None
+
+    cache.set(key, b"body", url="https://x.org/a", status=200)
+    meta, body = cache.get(key)
+    assert (meta["status"], body) == (200, b"body")
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    cache.ttl = 0
+    assert cache.get(key) is None
+
+
+def test_response_cache_evicts_least_recently_used(tmp_path):
+    cache = ResponseCache(tmp_path, max_bytes=10**6)
+    keys = [ResponseCache.key("GET", f"https://x.org/{i}") for i in range(3)]
+    for i, key in enumerate(keys):
+        cache.set(key, os.urandom(1000), status=200)
+        os.utime(cache._path(key), (i, i))
+    # Reading the oldest entry makes it the most recently used
+    cache.get(keys[0])
+
+    cache.max_bytes = cache._scan_size() - 1
+    cache.set(ResponseCache.key("GET", "https://x.org/3"), b"", status=200)
+    assert cache.get(keys[0]) is not None
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[2]) is not None
+
+
+def test_response_cache_hit_survives_concurrent_eviction(tmp_path):
+    cache = ResponseCache(tmp_path)
+    key = ResponseCache.key("GET", "https://x.org/a")
+    cache.set(key, b"body", status=200)
+
+    with mock.patch("os.utime", side_effect=FileNotFoundError):
+        meta, body = cache.get(key)
+    assert body == b"body"
+    assert cache.hits == 1
+
+
+def test_cached_session_serves_repeat_gets_from_disk(tmp_path):
+    session = CachedSession(ResponseCache(tmp_path))
+    response = requests.Response()
+    response.status_code = 200
+    response._content = b"<html></html>"
+    response.headers["Content-Type"] = "text/html; charset=utf-8"
+
+    with mock.patch.object(
+        requests.Session, "send", return_value=response
+    ) as send:
+        first = session.get("https://x.org/report", params={"ipid": 1})
+        second = session.get("https://x.org/report?ipid=1")
+
+    assert send.call_count == 1
+    assert first.text == second.text == "<html></html>"
+    assert second.headers["X-Cache"] == "hit"
+    assert second.encoding == "utf-8"
+
+
+def test_cached_session_rate_limits_only_network_requests(tmp_path):
+    bucket = mock.Mock()
+    session = CachedSession(ResponseCache(tmp_path), bucket=bucket)
+    response = requests.Response()
+    response.status_code = 200
+    response._content = b"{}"
+
+    with mock.patch.object(requests.Session, "send", return_value=response):
+        session.get("https://x.org/a")
+        session.get("https://x.org/a")
+
+    assert bucket.wait.call_count == 1
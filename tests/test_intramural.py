@@ -0,0 +1,47 @@
+from pathlib import Path
+
+import pytest
+
+from dsst_etl.intramural import parse_report, report_rows
+
+FIXTURES = Path(__file__).parent / "intramural-test"
+
+
+def read_fixture(name):
+    return (FIXTURES / name).read_text()
+
+
+@pytest.mark.parametrize("parser", ["lxml", "html.parser"])
+def test_parse_report(parser):
+    report = parse_report(read_fixture("report_multiple_pis.html"), parser)
+    assert report == {
+        "project": "BC010001-05",
+        # IRP affiliations are not investigators
+        "pis": ["Jane Q. Doe, PhD", "John Roe"],
+        "publications": [
+            ("38000001", "10.1016/j.jbc.2024.105001"),
+            ("38000002", ""),
+            ("", "10.1101/2024.01.01.573001"),
+            ("", ""),
+        ],
+    }
+
+
+@pytest.mark.parametrize("fixture", sorted(p.name for p in FIXTURES.glob("*.html")))
+def test_parsers_agree(fixture):
+    html = read_fixture(fixture)
+    assert parse_report(html, "lxml") == parse_report(html, "html.parser")
+
+
+def test_report_rows():
+    report = parse_report(read_fixture("report_core_lead.html"))
+    # the publication is listed twice, but gives one row
+    assert report_rows(report, 123) == [
+        (123, "Alex Smith, MD, PhD", 38000003, "10.1002/cyto.a.24800", "HL002345-03")
+    ]
+    assert report_rows(parse_report(read_fixture("report_no_pis.html")), 1) == []
+
+
+def test_unknown_parser():
+    with pytest.raises(ValueError):
+        parse_report("<html></html>", "html5lib")
@@ -1,5 +1,10 @@
+import gzip
 import logging
+import tempfile
 import unittest
+from pathlib import Path
+from unittest.mock import MagicMock
+
 from dsst_etl.oddpub_wrapper import OddpubWrapper
 from dsst_etl.models import OddpubMetrics
 
@@ -24,7 +29,86 @@ class TestOddpubWrapper(BaseTest):
         articles = [row.article for row in data]
         self.assertIn("test1.txt", articles)
         self.assertIn("test2.txt", articles)
-        
+
+    def test_process_texts_uses_text_endpoint(self):
+        def fake_post(url, files):
+            response = MagicMock()
+            response.json.return_value = {
+                "article": Path(files["file"].name).name.split(".")[0] + ".txt",
+                "is_open_data": False,
+            }
+            return response
+
+        mock_post = MagicMock(side_effect=fake_post)
+        self.wrapper.http_session.post = mock_post
+        with tempfile.TemporaryDirectory() as text_folder:
+            Path(text_folder, "test1.txt").write_text("plain text")
+            with gzip.open(Path(text_folder, "test2.txt.gz"), "wt") as f:
+                f.write("compressed text")
+
+            self.wrapper.process_texts(text_folder, force_upload=True)
+
+        urls = [call.args[0] for call in mock_post.call_args_list]
+        self.assertEqual(urls, ["http://mock-api/oddpub/text"] * 2)
+        articles = [row.article for row in self.session.query(OddpubMetrics).all()]
+        self.assertIn("test1.txt", articles)
+        self.assertIn("test2.txt", articles)
+
+    def test_process_pdfs_commits_in_batches(self):
+        response = MagicMock()
+        response.json.side_effect = [
+            {"article": "test1.txt", "is_open_data": False},
+            [
+                {"article": "test2.txt", "is_open_data": True},
+                {"article": "test3.txt", "is_open_data": False},
+            ],
+        ]
+        self.wrapper.http_session.post = MagicMock(return_value=response)
+        self.wrapper.batch_size = 1
+
+        uploaded = self.wrapper.process_pdfs("tests/pdf-test", force_upload=True)
+
+        self.assertEqual(uploaded, 3)
+        self.assertEqual(self.wrapper.http_session.post.call_count, 2)
+        self.assertEqual(self.session.query(OddpubMetrics).count(), 3)
+
+    def test_process_pdfs_resume_skips_scored_articles(self):
+        self.session.add(OddpubMetrics(article="test1.txt"))
+        self.session.commit()
+        response = MagicMock()
+        response.json.return_value = {"article": "test2.txt"}
+        self.wrapper.http_session.post = MagicMock(return_value=response)
+
+        uploaded = self.wrapper.process_pdfs(
+            "tests/pdf-test", force_upload=True, resume=True
+        )
+
+        self.assertEqual(uploaded, 1)
+        self.assertEqual(self.wrapper.http_session.post.call_count, 1)
+        self.assertEqual(self.session.query(OddpubMetrics).count(), 2)
+
+    def test_repeat_results_do_not_fail_the_batch(self):
+        response = MagicMock()
+        response.json.side_effect = [{"article": "test1.txt"}, {"article": "test2.txt"}]
+        self.wrapper.http_session.post = MagicMock(return_value=response)
+        self.session.add(OddpubMetrics(article="test1.txt"))
+        self.session.commit()
+
+        uploaded = self.wrapper.process_pdfs("tests/pdf-test", force_upload=True)
+
+        self.assertEqual(uploaded, 1)
+        self.assertEqual(self.session.query(OddpubMetrics).count(), 2)
+
+    def test_database_error_is_raised(self):
+        response = MagicMock()
+        response.json.return_value = {"article": "test1.txt"}
+        self.wrapper.http_session.post = MagicMock(return_value=response)
+        self.wrapper.batch_size = 1
+        self.wrapper._upload_batch = MagicMock(side_effect=RuntimeError("db down"))
+
+        with self.assertRaises(RuntimeError):
+            self.wrapper.process_pdfs("tests/pdf-test", force_upload=True)
+
 
 if __name__ == "__main__":
     unittest.main()
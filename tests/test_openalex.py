@@ -0,0 +1,95 @@
+import asyncio
+import gzip
+import json
+import tempfile
+from pathlib import Path
+from unittest.mock import AsyncMock
+
+from dsst_etl.openalex import (
+    OpenAlexHarvester,
+    WorksPartWriter,
+    normalize_doi,
+    work_key,
+)
+
+
+def make_work(pmid, doi=None):
+    return {
+        "id": f"https://openalex.org/W{pmid}",
+        "doi": doi,
+        "ids": {"pmid": f"https://pubmed.ncbi.nlm.nih.gov/{pmid}"},
+    }
+
+
+def test_work_key_normalizes_ids():
+    work = make_work("123", "https://doi.org/10.1000/ABC")
+    assert work_key(work, "pmid") == "123"
+    assert work_key(work, "doi") == "10.1000/abc"
+    assert normalize_doi(" https://doi.org/10.1000/ABC ") == "10.1000/abc"
+
+
+def test_fetch_batch_splits_results_and_falls_back_for_misses():
+    harvester = OpenAlexHarvester()
+
+    async def fake_get(session, path, params=None):
+        if path == "works":
+            assert params["filter"] == "pmid:1|2|3"
+            return {"results": [make_work("2"), make_work("1"), make_work("99")]}
+        return make_work("3") if path == "works/pmid:3" else None
+
+    harvester._get = AsyncMock(side_effect=fake_get)
+    works = asyncio.run(harvester._fetch_batch(None, "pmid", ["1", "2", "3"]))
+
+    assert {pmid: work["id"] for pmid, work in works.items()} == {
+        "1": "https://openalex.org/W1",
+        "2": "https://openalex.org/W2",
+        "3": "https://openalex.org/W3",
+    }
+    # One filter query plus a single lookup for the id it missed
+    assert harvester._get.await_count == 2
+
+
+def read_parts(works_dir):
+    return [
+        json.loads(line)["id"]
+        for part in sorted(Path(works_dir).glob("*.gz"))
+        for line in gzip.open(part, "rt")
+    ]
+
+
+def test_works_part_writer_rotates_and_checkpoints():
+    with tempfile.TemporaryDirectory() as tmp:
+        works_dir, checkpoint = Path(tmp, "works"), Path(tmp, "checkpoint.txt")
+        with WorksPartWriter(works_dir, checkpoint, records_per_part=2) as writer:
+            for pmid in ["1", "2", "3"]:
+                writer.write(f"pmid:{pmid}", json.dumps(make_work(pmid)))
+
+        assert sorted(p.name for p in works_dir.iterdir()) == [
+            "part_0000.gz",
+            "part_0001.gz",
+        ]
+        assert read_parts(works_dir)[-1] == "https://openalex.org/W3"
+        assert WorksPartWriter.read_checkpoint(checkpoint) == {
+            "pmid:1",
+            "pmid:2",
+            "pmid:3",
+        }
+
+
+def test_works_part_writer_salvages_checkpointed_records_after_crash():
+    with tempfile.TemporaryDirectory() as tmp:
+        works_dir, checkpoint = Path(tmp, "works"), Path(tmp, "checkpoint.txt")
+        writer = WorksPartWriter(works_dir, checkpoint, flush_every=2)
+        for pmid in ["1", "2", "3"]:
+            writer.write(f"pmid:{pmid}", json.dumps(make_work(pmid)))
+        # Simulate a crash: the part is never closed and pmid:3 is not flushed
+        writer._part.fileobj.flush()
+
+        resumed = WorksPartWriter(works_dir, checkpoint)
+        resumed.close()
+
+        assert resumed.done_ids == {"pmid:1", "pmid:2"}
+        assert read_parts(works_dir) == [
+            "https://openalex.org/W1",
+            "https://openalex.org/W2",
+        ]
@@ -0,0 +1,117 @@
+import json
+from unittest import mock
+
+import pandas as pd
+import requests
+
+from dsst_etl.pubmed import (
+    PubMedClient,
+    non_article_pmids,
+    one_hot_publication_types,
+    parse_publication_types,
+    parse_summaries,
+    publication_types_long,
+)
+
+
+def article(pmid, *types):
+    publication_types = "".join(
+        f'<PublicationType UI="D{i}">{name}</PublicationType>'
+        for i, name in enumerate(types)
+    )
+    return (
+        "<PubmedArticle><MedlineCitation><PMID Version='1'>"
+        f"{pmid}</PMID><Article><PublicationTypeList>{publication_types}"
+        "</PublicationTypeList></Article></MedlineCitation>"
+        # references carry PMIDs too, which must not be picked up
+        "<PubmedData><ReferenceList><Reference><ArticleIdList>"
+        '<ArticleId IdType="pubmed">999</ArticleId>'
+        "</ArticleIdList></Reference></ReferenceList></PubmedData>"
+        "</PubmedArticle>"
+    )
+
+
+def article_set(*articles):
+    return f"<PubmedArticleSet>{''.join(articles)}</PubmedArticleSet>".encode()
+
+
+def test_parse_publication_types():
+    xml = article_set(article(1, "Journal Article", "Review"), article(2, "Editorial"))
+    assert parse_publication_types(xml) == {
+        "1": {"D0": "Journal Article", "D1": "Review"},
+        "2": {"D0": "Editorial"},
+    }
+
+
+def response(content):
+    resp = requests.Response()
+    resp.status_code = 200
+    resp._content = content
+    return resp
+
+
+def test_fetch_publication_types_batches_and_retries_missing_ids():
+    session = mock.Mock()
+    requested = []
+
+    def get(url, params, timeout):
+        ids = params["id"].split(",")
+        requested.append(ids)
+        # PMID 3 is only returned when asked for again
+        returned = [pmid for pmid in ids if pmid != "3" or len(ids) == 1]
+        return response(
+            article_set(*(article(pmid, "Journal Article") for pmid in returned))
+        )
+
+    session.get.side_effect = get
+    client = PubMedClient(session=session, rate=1000, concurrency=2)
+
+    results, failed = client.fetch_publication_types([1, 2, 3, 4, 5, 2], batch_size=2)
+
+    assert sorted(results) == ["1", "2", "3", "4", "5"]
+    assert failed == []
+    assert sorted(requested) == [["1", "2"], ["3"], ["3", "4"], ["5"]]
+
+
+def test_publication_types_long_and_one_hot(tmp_path):
+    long_df = publication_types_long(
+        {
+            "1": {"D0": "Journal Article", "D1": "Review"},
+            "2": {"D0": "Journal Article"},
+            "3": {"D0": "Editorial"},
+        }
+    )
+    path = tmp_path / "publication_types.parquet"
+    long_df.to_parquet(path, index=False)
+    long_df = pd.read_parquet(path)
+
+    assert len(long_df) == 4
+    assert non_article_pmids(long_df).tolist() == [1, 3]
+
+    one_hot_df = one_hot_publication_types(long_df)
+    assert one_hot_df.columns.tolist() == [
+        "Editorial",
+        "Journal Article",
+        "Review",
+        "PMID",
+    ]
+    assert one_hot_df.to_dict("records") == [
+        {"Editorial": False, "Journal Article": True, "Review": True, "PMID": 1},
+        {"Editorial": False, "Journal Article": True, "Review": False, "PMID": 2},
+        {"Editorial": True, "Journal Article": False, "Review": False, "PMID": 3},
+    ]
+
+
+def test_parse_summaries_skips_errors():
+    data = json.dumps(
+        {
+            "result": {
+                "uids": ["1", "2"],
+                "1": {"uid": "1", "title": "A title.", "source": "J Biol Chem"},
+                "2": {"uid": "2", "error": "cannot get document summary"},
+            }
+        }
+    ).encode()
+    assert parse_summaries(data) == {
+        "1": {"title": "A title.", "journal": "J Biol Chem"}
+    }